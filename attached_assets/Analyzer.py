@@ -1,61 +1,452 @@
 import os
 import re
+import sys
+import time
+import mmap
 import json
-from collections import defaultdict
+import shutil
+import argparse
+from collections import Counter, defaultdict, deque
+from multiprocessing import Pool
 
 log_file_path = 'Sample_logs/auth.log'
 report_dir = 'reports'
 report_file = os.path.join(report_dir, 'summary.json')
-
-if not os.path.exists(report_dir):
-    os.makedirs(report_dir)
+details_file = os.path.join(report_dir, 'failed_attempts.jsonl')
+follow_state_file = os.path.join(report_dir, 'follow_state.json')
+alerts_file = os.path.join(report_dir, 'alerts.jsonl')
 
 # Regex to match: Date, User (valid/invalid), IP and Port
-pattern = r'^(\w{3} \d{1,2} \d{2}:\d{2}:\d{2}) .*sshd.*Failed password for (invalid user )?(\w+) from ([\d.]+) port (\d+)'
-
-failed_attempts = []
-ip_summary = defaultdict(lambda: {
-    "attempts": 0,
-    "users": set(),
-    "timestamps": []
-})
-
-# Read log file and analyze
-with open(log_file_path, 'r') as file:
-    for line in file:
-        match = re.search(pattern, line)
-        if match:
-            timestamp = match.group(1)
-            user = match.group(3)
-            ip = match.group(4)
-
-            # Store individual failed attempt
-            failed_attempts.append({
-                "timestamp": timestamp,
-                "user": user,
-                "ip": ip,
-                "raw": line.strip()
-            })
-
-            # Update summary per IP
-            ip_summary[ip]["attempts"] += 1
-            ip_summary[ip]["users"].add(user)
-            ip_summary[ip]["timestamps"].append(timestamp)
-
-# Convert sets to lists for JSON serialization
-for ip in ip_summary:
-    ip_summary[ip]["users"] = list(ip_summary[ip]["users"])
-
-# Save detailed report
-report_data = {
-    "total_failed_attempts": len(failed_attempts),
-    "ip_summary": dict(ip_summary),
-    "logs": failed_attempts
-}
-
-with open(report_file, 'w') as outfile:
-    json.dump(report_data, outfile, indent=4)
-
-print(f"[+] Analysis complete. {len(failed_attempts)} failed attempts analyzed.")
-print(f"[+] Unique IPs involved: {len(ip_summary)}")
-print(f"[+] Report saved to {report_file}")
+pattern = re.compile(r'^(\w{3} \d{1,2} \d{2}:\d{2}:\d{2}) .*sshd.*Failed password for (invalid user )?(\w+) from ([\d.]+) port (\d+)')
+
+# Every line the pattern matches contains this, checking it first skips the regex for most lines
+prefilter = 'Failed password'
+prefilter_bytes = prefilter.encode()
+
+# Usernames reported per IP in streaming mode
+TOP_USERS = 10
+# Usernames counted per IP in streaming mode, the least frequent are dropped after each range
+USER_SLOTS = 100
+# Bytes of log scanned per range in streaming mode, ranges are what workers run in parallel
+RANGE_SIZE = 16 * 1024 * 1024
+# Seconds between checks for new lines in follow mode
+FOLLOW_INTERVAL = 2.0
+
+# Default thresholds of the brute-force detector
+DETECT_WINDOW = 60
+MAX_FAILURES = 10
+MAX_USERS = 5
+
+MONTHS = {name: number for number, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+def parse_line(line):
+    """Return (timestamp, user, ip) of a failed SSH login line, or None."""
+    if prefilter not in line:
+        return None
+    match = pattern.match(line)
+    if not match:
+        return None
+    return match.group(1), match.group(3), match.group(4)
+
+def analyze(path):
+    """Analyze a whole log in memory, returning the full report with every attempt."""
+    failed_attempts = []
+    ip_summary = defaultdict(lambda: {
+        "attempts": 0,
+        "users": set(),
+        "timestamps": []
+    })
+
+    with open(path, 'r') as file:
+        for line in file:
+            parsed = parse_line(line)
+            if parsed:
+                timestamp, user, ip = parsed
+
+                # Store individual failed attempt
+                failed_attempts.append({
+                    "timestamp": timestamp,
+                    "user": user,
+                    "ip": ip,
+                    "raw": line.strip()
+                })
+
+                # Update summary per IP
+                ip_summary[ip]["attempts"] += 1
+                ip_summary[ip]["users"].add(user)
+                ip_summary[ip]["timestamps"].append(timestamp)
+
+    # Convert sets to lists for JSON serialization
+    for ip in ip_summary:
+        ip_summary[ip]["users"] = list(ip_summary[ip]["users"])
+
+    return {
+        "total_failed_attempts": len(failed_attempts),
+        "ip_summary": dict(ip_summary),
+        "logs": failed_attempts
+    }
+
+def split_ranges(path, range_size=RANGE_SIZE):
+    """Split a file into (start, end) byte ranges of about range_size, each ending after a newline."""
+    total = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as file:
+        while start < total:
+            end = start + range_size
+            if end < total:
+                file.seek(end)
+                file.readline()
+                end = file.tell()
+            end = min(end, total)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def scan_range(path, start, end, details):
+    """Aggregate the failed attempts found in a byte range of the log, writing each attempt to details."""
+    ip_summary = {}
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+        position = start
+        while True:
+            # Jump straight to the next candidate line instead of reading every line
+            hit = log.find(prefilter_bytes, position, end)
+            if hit < 0:
+                break
+            line_start = max(log.rfind(b'\n', start, hit) + 1, start)
+            line_end = log.find(b'\n', hit, end)
+            line_end = end if line_end < 0 else line_end + 1
+            position = line_end
+
+            line = log[line_start:line_end].decode('utf-8', errors='replace')
+            parsed = parse_line(line)
+            if parsed:
+                timestamp, user, ip = parsed
+                stats = ip_summary.get(ip)
+                if stats is None:
+                    stats = ip_summary[ip] = {
+                        "attempts": 0,
+                        "users": Counter(),
+                        "first_seen": timestamp,
+                        "last_seen": timestamp
+                    }
+                stats["attempts"] += 1
+                stats["users"][user] += 1
+                stats["last_seen"] = timestamp
+                details.write(json.dumps({
+                    "timestamp": timestamp,
+                    "user": user,
+                    "ip": ip,
+                    "raw": line.strip()
+                }) + "\n")
+    return ip_summary
+
+def scan_range_to_file(task):
+    """Pool worker: scan_range() writing the attempts to a part file of its own."""
+    path, start, end, part_path = task
+    with open(part_path, 'w') as details:
+        return scan_range(path, start, end, details)
+
+def merge_summary(ip_summary, range_summary, slots=USER_SLOTS):
+    """Fold the aggregates of the next range into ip_summary, keeping at most slots usernames per IP."""
+    for ip, stats in range_summary.items():
+        total = ip_summary.get(ip)
+        if total is None:
+            total = ip_summary[ip] = stats
+        else:
+            total["attempts"] += stats["attempts"]
+            total["users"].update(stats["users"])
+            total["last_seen"] = stats["last_seen"]
+        if len(total["users"]) > slots:
+            kept = sorted(total["users"].items(), key=lambda item: (-item[1], item[0]))[:slots]
+            total["users"] = Counter(dict(kept))
+
+def summarize(ip_summary, top_users=TOP_USERS):
+    """JSON friendly copy of the streaming aggregates with the top users of each IP."""
+    return {
+        ip: {
+            "attempts": stats["attempts"],
+            "top_users": dict(sorted(stats["users"].items(), key=lambda item: (-item[1], item[0]))[:top_users]),
+            "first_seen": stats["first_seen"],
+            "last_seen": stats["last_seen"]
+        }
+        for ip, stats in ip_summary.items()
+    }
+
+def analyze_stream(path, details_path, top_users=TOP_USERS, workers=1):
+    """Analyze a log keeping only per-IP aggregates, attempts are written to a JSONL file range by range.
+
+    The log is memory-mapped and cut into line-aligned ranges of RANGE_SIZE bytes. With several
+    workers the ranges are scanned in parallel, their aggregates and attempts are merged in range
+    order, so the result does not depend on the number of workers.
+    """
+    ip_summary = {}
+    ranges = split_ranges(path)
+
+    if workers <= 1:
+        with open(details_path, 'w') as details:
+            for start, end in ranges:
+                merge_summary(ip_summary, scan_range(path, start, end, details))
+    else:
+        tasks = [(path, start, end, f"{details_path}.{index}.part") for index, (start, end) in enumerate(ranges)]
+        with Pool(workers) as pool, open(details_path, 'wb') as details:
+            for task, range_summary in zip(tasks, pool.imap(scan_range_to_file, tasks)):
+                merge_summary(ip_summary, range_summary)
+                with open(task[3], 'rb') as part:
+                    shutil.copyfileobj(part, details)
+                os.remove(task[3])
+
+    return {
+        "total_failed_attempts": sum(stats["attempts"] for stats in ip_summary.values()),
+        "ip_summary": summarize(ip_summary, top_users),
+        "details_file": details_path
+    }
+
+def write_json(data, path, indent=None):
+    """Replace a JSON file atomically, readers never see it half written."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as outfile:
+        json.dump(data, outfile, indent=indent)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmp_path, path)
+
+def write_report(report_data, path):
+    """Write the report as indented JSON."""
+    write_json(report_data, path, indent=4)
+
+def load_follow_state(path):
+    """Saved position and aggregates of follow mode, empty when starting afresh."""
+    try:
+        with open(path) as infile:
+            state = json.load(infile)
+    except FileNotFoundError:
+        return {"inode": None, "offset": 0, "ip_summary": {}}
+    for stats in state["ip_summary"].values():
+        stats["users"] = Counter(stats["users"])
+    return state
+
+def scan_appended(path, offset, ip_summary, details, complete_lines=True):
+    """Merge the attempts written to a log after offset, returning the offset reached.
+
+    With complete_lines a trailing line without its newline is left for the next call.
+    """
+    size = os.path.getsize(path)
+    if size <= offset:
+        return offset
+    end = size
+    if complete_lines:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            end = log.rfind(b'\n', offset, size) + 1
+        if end <= offset:
+            return offset
+    merge_summary(ip_summary, scan_range(path, offset, end, details))
+    return end
+
+def follow_log(path, state, details):
+    """Catch up with a followed log, switching files when logrotate moved or truncated it."""
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        # Rotated away and not recreated yet
+        return
+    if state["inode"] is not None and state["inode"] != inode:
+        # Finish the previous file when it was renamed next to the log
+        rotated = path + '.1'
+        if os.path.exists(rotated) and os.stat(rotated).st_ino == state["inode"]:
+            scan_appended(rotated, state["offset"], state["ip_summary"], details, complete_lines=False)
+        state["offset"] = 0
+    elif os.path.getsize(path) < state["offset"]:
+        # Truncated in place (copytruncate)
+        state["offset"] = 0
+    state["inode"] = inode
+    state["offset"] = scan_appended(path, state["offset"], state["ip_summary"], details)
+
+def follow(path, report_path, details_path, state_path, top_users=TOP_USERS, interval=FOLLOW_INTERVAL):
+    """Keep the summary of a growing log up to date, reading only the lines added since the last check."""
+    state = load_follow_state(state_path)
+    saved = None
+    with open(details_path, 'a') as details:
+        while True:
+            follow_log(path, state, details)
+            position = (state["inode"], state["offset"])
+            if position != saved:
+                details.flush()
+                ip_summary = state["ip_summary"]
+                write_report({
+                    "total_failed_attempts": sum(stats["attempts"] for stats in ip_summary.values()),
+                    "ip_summary": summarize(ip_summary, top_users),
+                    "details_file": details_path
+                }, report_path)
+                write_json(state, state_path)
+                saved = position
+            time.sleep(interval)
+
+class SyslogClock:
+    """Convert syslog timestamps, which carry no year and are in local time, to epoch seconds.
+
+    The year starts as the current one, or the previous one when the log starts in a later month
+    than today, and moves forward whenever the month jumps back, e.g. from Dec to Jan.
+    """
+
+    def __init__(self, year=None):
+        self.year = year
+        self.month = None
+        self.hour_starts = {}
+
+    def epoch(self, timestamp):
+        month_name, day, clock = timestamp.split()
+        month = MONTHS[month_name]
+        if self.year is None:
+            today = time.localtime()
+            self.year = today.tm_year - 1 if month > today.tm_mon else today.tm_year
+        elif self.month is not None and self.month - month >= 6:
+            self.year += 1
+        self.month = month
+
+        hours, minutes, seconds = clock.split(':')
+        # Cached per hour, as DST changes the UTC offset on an hour boundary
+        key = (self.year, month, day, hours)
+        hour_start = self.hour_starts.get(key)
+        if hour_start is None:
+            hour_start = self.hour_starts[key] = int(time.mktime((self.year, month, int(day), int(hours), 0, 0, 0, 0, -1)))
+        return hour_start + int(minutes) * 60 + int(seconds)
+
+class BruteForceDetector:
+    """Sliding-window brute-force detection over failed attempts.
+
+    An IP is flagged when it fails max_failures times, or tries max_users distinct usernames,
+    within window seconds. Each IP keeps a ring buffer of its last max_failures attempt times and
+    the last time of at most max_users usernames, and is forgotten once idle for a whole window,
+    so memory follows the number of active IPs.
+    """
+
+    def __init__(self, window=DETECT_WINDOW, max_failures=MAX_FAILURES, max_users=MAX_USERS):
+        self.window = window
+        self.max_failures = max_failures
+        self.max_users = max_users
+        self.failures = {}
+        self.users = {}
+        self.last_sweep = None
+
+    def add(self, epoch, user, ip):
+        """Record a failed attempt, returning the alerts it raises."""
+        alerts = []
+        cutoff = epoch - self.window
+
+        failures = self.failures.get(ip)
+        if failures is None:
+            failures = self.failures[ip] = deque(maxlen=self.max_failures)
+        failures.append(epoch)
+        if len(failures) == self.max_failures and failures[0] >= cutoff:
+            alerts.append({"ip": ip, "rule": "failures", "count": len(failures), "start": failures[0], "end": epoch})
+            failures.clear()
+
+        # Usernames ordered by last use, oldest first
+        users = self.users.setdefault(ip, {})
+        users.pop(user, None)
+        users[user] = epoch
+        while users[next(iter(users))] < cutoff:
+            del users[next(iter(users))]
+        if len(users) >= self.max_users:
+            alerts.append({"ip": ip, "rule": "users", "count": len(users), "users": list(users),
+                           "start": users[next(iter(users))], "end": epoch})
+            users.clear()
+
+        if self.last_sweep is None or epoch - self.last_sweep >= self.window:
+            self.sweep(epoch)
+        return alerts
+
+    def sweep(self, now):
+        """Forget the IPs without an attempt in the last window."""
+        cutoff = now - self.window
+        for ip in [ip for ip, failures in self.failures.items() if not failures or failures[-1] < cutoff]:
+            del self.failures[ip]
+        for ip in [ip for ip, users in self.users.items() if not users or users[next(reversed(users))] < cutoff]:
+            del self.users[ip]
+        self.last_sweep = now
+
+def detect(path, alerts_path, window=DETECT_WINDOW, max_failures=MAX_FAILURES, max_users=MAX_USERS):
+    """Run the brute-force detector over a log, '-' for stdin, appending alerts as JSONL. Returns the alert count."""
+    clock = SyslogClock()
+    detector = BruteForceDetector(window, max_failures, max_users)
+    count = 0
+    with (sys.stdin if path == '-' else open(path, 'r')) as file, open(alerts_path, 'a') as alerts:
+        for line in file:
+            parsed = parse_line(line)
+            if parsed:
+                timestamp, user, ip = parsed
+                for alert in detector.add(clock.epoch(timestamp), user, ip):
+                    alert["timestamp"] = timestamp
+                    alerts.write(json.dumps(alert) + "\n")
+                    alerts.flush()
+                    count += 1
+    return count
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Summarize failed SSH logins found in an auth.log")
+    parser.add_argument("--log", default=log_file_path, help=f"Log file to analyze (default: {log_file_path})")
+    parser.add_argument("--report", default=report_file, help=f"Summary report to write (default: {report_file})")
+    parser.add_argument("--stream", action="store_true",
+                        help="Keep only per-IP aggregates in memory and write every attempt to --details as JSONL")
+    parser.add_argument("--details", default=details_file, help=f"JSONL file of attempts in streaming mode (default: {details_file})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes scanning the log in parallel in streaming mode (default: 1)")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep running and update the streaming report as lines are appended to the log")
+    parser.add_argument("--state", default=follow_state_file,
+                        help=f"Offset, inode and aggregates saved by follow mode (default: {follow_state_file})")
+    parser.add_argument("--interval", type=float, default=FOLLOW_INTERVAL,
+                        help=f"Seconds between checks for new lines in follow mode (default: {FOLLOW_INTERVAL})")
+    parser.add_argument("--detect", action="store_true",
+                        help="Run the sliding-window brute-force detector over the log ('-' reads stdin) and append alerts to --alerts")
+    parser.add_argument("--alerts", default=alerts_file, help=f"JSONL file of detector alerts (default: {alerts_file})")
+    parser.add_argument("--window", type=int, default=DETECT_WINDOW, help=f"Detector window in seconds (default: {DETECT_WINDOW})")
+    parser.add_argument("--max-failures", type=int, default=MAX_FAILURES,
+                        help=f"Failures from one IP within the window that raise an alert (default: {MAX_FAILURES})")
+    parser.add_argument("--max-users", type=int, default=MAX_USERS,
+                        help=f"Distinct usernames from one IP within the window that raise an alert (default: {MAX_USERS})")
+    parser.add_argument("--top-users", type=int, default=TOP_USERS, help=f"Usernames reported per IP in streaming mode (default: {TOP_USERS})")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_args(argv[1:])
+
+    if args.detect:
+        outputs = [args.alerts]
+    elif args.follow:
+        outputs = [args.report, args.details, args.state]
+    else:
+        outputs = [args.report, args.details] if args.stream else [args.report]
+    for path in outputs:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    if args.detect:
+        count = detect(args.log, args.alerts, args.window, args.max_failures, args.max_users)
+        print(f"[+] Detection complete. {count} alerts raised.")
+        print(f"[+] Alerts saved to {args.alerts}")
+        return
+
+    if args.follow:
+        print(f"[+] Following {args.log}, report kept in {args.report}")
+        try:
+            follow(args.log, args.report, args.details, args.state, args.top_users, args.interval)
+        except KeyboardInterrupt:
+            print(f"[+] Stopped, position saved to {args.state}")
+        return
+
+    if args.stream:
+        report_data = analyze_stream(args.log, args.details, args.top_users, args.workers)
+    else:
+        report_data = analyze(args.log)
+    write_report(report_data, args.report)
+
+    print(f"[+] Analysis complete. {report_data['total_failed_attempts']} failed attempts analyzed.")
+    print(f"[+] Unique IPs involved: {len(report_data['ip_summary'])}")
+    print(f"[+] Report saved to {args.report}")
+    if args.stream:
+        print(f"[+] Attempts saved to {args.details}")
+
+if __name__ == "__main__":
+    main(sys.argv)
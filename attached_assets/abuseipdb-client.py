@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+# Active response shim for abuseipdb-reputation.py: hands the alert to the
+# long-running worker (abuseipdb-reputation.py --worker) over its Unix socket,
+# so Wazuh does not start a full interpreter with requests for every alert.
+# Falls back to running abuseipdb-reputation.py directly when no worker answers.
+
+import sys
+import os
+import json
+import socket
+import subprocess
+
+# Configuration
+WORKER_SOCKET = os.environ.get("ABUSEIPDB_WORKER_SOCKET", "/var/ossec/var/run/abuseipdb-reputation.sock")
+SOCKET_TIMEOUT = 5  # Seconds to wait for the worker before falling back
+REPUTATION_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abuseipdb-reputation.py")
+
+# Constants
+OS_SUCCESS = 0
+OS_INVALID = -1
+
+def send(message, path=WORKER_SOCKET):
+    """Send one JSON line to the worker and return its decoded reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(SOCKET_TIMEOUT)
+        client.connect(path)
+        client.sendall(message.encode() + b"\n")
+        reply = client.makefile("rb").readline()
+    return json.loads(reply)
+
+def main(argv):
+    if argv[1:] == ["--stats"]:
+        print(json.dumps(send(json.dumps({"command": "stats"})), indent=2))
+        return OS_SUCCESS
+
+    # Read alert from STDIN
+    message = sys.stdin.readline().strip()
+    try:
+        reply = send(message)
+    except (OSError, ValueError):
+        # No worker running: check the alert in this process instead
+        return subprocess.run([sys.executable, REPUTATION_SCRIPT], input=message + "\n", text=True).returncode
+    return OS_INVALID if "error" in reply else OS_SUCCESS
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
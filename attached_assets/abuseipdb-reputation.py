@@ -4,29 +4,87 @@ import sys
 import json
 import requests
 import os
+import time
+import queue
+import shlex
+import signal
+import socket
+import sqlite3
+import argparse
+import ipaddress
 import datetime
+import threading
 import subprocess
+import collections
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configuration
 LOG_FILE = "/var/ossec/logs/active-responses.log"
 MIKROTIK_IP = "192.168.1.1"  # Mikrotik Router IP
 SSH_KEY_PATH = "/var/ossec/.ssh/id_rsa"  # Path to the private SSH key
 ABUSEIPDB_API_KEY = "<YOUR-API-KEY-HERE>"  # Replace with your API KEY
-ABUSEIPDB_API_URL = "https://api.abuseipdb.com/api/v2/check"
+ABUSEIPDB_API_URL = os.environ.get("ABUSEIPDB_API_URL", "https://api.abuseipdb.com/api/v2/check")
 FIREWALL_COMMAND = "/ip firewall address-list add list=\"blocked-by-wazuh\" address={ip} timeout=90d comment=\"Added by Wazuh\""
+# Same command, skipped when the address is already on the list
+FIREWALL_COMMAND_IF_MISSING = ":if ([:len [/ip firewall address-list find list=\"blocked-by-wazuh\" address={ip}]] = 0) do={{" + FIREWALL_COMMAND + "}}"
+SSH_COMMAND = shlex.split(os.environ.get("MIKROTIK_SSH_COMMAND", "ssh"))  # Override to test against a fake endpoint
+SSH_CONTROL_PATH = "/var/ossec/.ssh/cm-%r@%h:%p"  # Master connection reused by every invocation
+SSH_CONTROL_PERSIST = 300  # Seconds the master connection stays open after its last use
+BLOCK_BATCH_SIZE = 100  # IPs sent to the router per SSH command
 REPUTATION_THRESHOLD = 25  # Confidence score threshold (0-100), adjust as needed
+REQUEST_TIMEOUT = 10  # Seconds to wait for AbuseIPDB before giving up
+CACHE_DB = "/var/ossec/var/abuseipdb-cache.sqlite"  # Reputation cache shared by all invocations
+CACHE_TTL = 24 * 3600  # Seconds a score is reused before AbuseIPDB is asked again
+NEGATIVE_CACHE_TTL = 300  # Seconds a failed lookup is remembered, so a storm does not retry it per alert
+CACHE_BUSY_TIMEOUT = 5  # Seconds to wait for another invocation holding the cache lock
+BATCH_WORKERS = 8  # Concurrent AbuseIPDB lookups in batch mode
+REQUEST_RETRIES = 3  # Retries of a lookup failing with a connection error, 429 or 5xx
+RETRY_BACKOFF = 0.5  # Backoff factor between retries: 0.5s, 1s, 2s, ...
+WORKER_SOCKET = os.environ.get("ABUSEIPDB_WORKER_SOCKET", "/var/ossec/var/run/abuseipdb-reputation.sock")  # Unix socket the worker listens on, shared with abuseipdb-client.py
+WORKER_FLUSH_INTERVAL = 1.0  # Seconds between flushes of the log and of the IPs queued for blocking
+WORKER_STATS_INTERVAL = 300  # Seconds between worker statistics written to the log
+LATENCY_SAMPLES = 1000  # Recent latencies kept per stage for the worker percentiles
+MAX_MESSAGE_SIZE = 1024 * 1024  # Longest alert accepted on the worker socket
 
 # Constants
 OS_SUCCESS = 0
 OS_INVALID = -1
 
+LOG_WRITER = None  # Buffered LogWriter used instead of LOG_FILE by the worker
+
 def write_debug_file(script_name, msg, log_file=LOG_FILE):
-    """Write debug messages to the specified log file."""
+    """Write debug messages to the specified log file, or to LOG_WRITER when the worker runs."""
+    timestamp = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+    line = f"{timestamp} {script_name}: {msg}\n"
+    if LOG_WRITER is not None:
+        LOG_WRITER.write(line)
+        return
     with open(log_file, mode="a") as file:
-        timestamp = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')
-        file.write(f"{timestamp} {script_name}: {msg}\n")
+        file.write(line)
+
+class LogWriter:
+    """Keep log lines in memory and append them to the log file with one write per flush."""
+
+    def __init__(self, log_file=LOG_FILE):
+        self.log_file = log_file
+        self.lines = []
+        self.lock = threading.Lock()
+
+    def write(self, line):
+        with self.lock:
+            self.lines.append(line)
+
+    def flush(self):
+        with self.lock:
+            lines, self.lines = self.lines, []
+        if lines:
+            with open(self.log_file, mode="a") as file:
+                file.write("".join(lines))
 
-def query_abuseipdb(ip, script_name):
+def query_abuseipdb(ip, script_name, session=None, api_url=ABUSEIPDB_API_URL):
     """Query AbuseIPDB for the IP reputation and return the result."""
     headers = {
         "Key": ABUSEIPDB_API_KEY,
@@ -38,31 +96,447 @@ def query_abuseipdb(ip, script_name):
     }
 
     try:
-        response = requests.get(ABUSEIPDB_API_URL, headers=headers, params=params)
+        response = (session or requests).get(api_url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # Raise an exception for bad status codes
         result = response.json()
         confidence_score = result["data"]["abuseConfidenceScore"]
+        if type(confidence_score) is not int:
+            raise TypeError(f"abuseConfidenceScore is {confidence_score!r}")
         return confidence_score  # Return the score (0-100)
     except requests.RequestException:
         return None  # Return None if the query fails
+    except (KeyError, TypeError, ValueError) as e:
+        # A 200 carrying {"errors": [...]} or another unexpected body is a failed lookup too
+        write_debug_file(script_name, f"Unexpected AbuseIPDB response for {ip}: {e!r}")
+        return None
+
+def create_session(workers=BATCH_WORKERS):
+    """Keep-alive session for concurrent lookups, retrying transient failures with exponential backoff."""
+    retry = Retry(
+        total=REQUEST_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504)
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def open_cache(path=CACHE_DB):
+    """Open the reputation cache, creating it on first use."""
+    conn = sqlite3.connect(path, timeout=CACHE_BUSY_TIMEOUT, isolation_level=None)
+    # WAL lets concurrent invocations read while one of them writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={CACHE_BUSY_TIMEOUT * 1000}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS reputation (ip TEXT PRIMARY KEY, score INTEGER, expires REAL NOT NULL)")
+    return conn
+
+def cached_score(conn, ip):
+    """Return (True, score) for an IP cached and not expired, score is None for a cached failure, else (False, None)."""
+    row = conn.execute("SELECT score FROM reputation WHERE ip = ? AND expires > ?", (ip, time.time())).fetchone()
+    if row is None:
+        return False, None
+    return True, row[0]
+
+def cache_score(conn, ip, score):
+    """Remember the score of an IP, None caches a failed lookup for NEGATIVE_CACHE_TTL."""
+    now = time.time()
+    ttl = CACHE_TTL if score is not None else NEGATIVE_CACHE_TTL
+    conn.execute("INSERT OR REPLACE INTO reputation (ip, score, expires) VALUES (?, ?, ?)", (ip, score, now + ttl))
+    conn.execute("DELETE FROM reputation WHERE expires <= ?", (now,))
+
+def lookup_cache(conn, ip, script_name):
+    """cached_score() that treats a missing or failing cache as a miss."""
+    if conn is not None:
+        try:
+            return cached_score(conn, ip)
+        except sqlite3.Error as e:
+            write_debug_file(script_name, f"Reputation cache lookup failed: {e}")
+    return False, None
+
+def store_cache(conn, ip, score, script_name):
+    """cache_score() that only logs when the cache is missing or failing."""
+    if conn is not None:
+        try:
+            cache_score(conn, ip, score)
+        except sqlite3.Error as e:
+            write_debug_file(script_name, f"Reputation cache update failed: {e}")
+
+def get_reputation(ip, script_name, conn=None, api_url=ABUSEIPDB_API_URL, session=None):
+    """Return the reputation score of an IP, from the cache while it is fresh."""
+    hit, score = lookup_cache(conn, ip, script_name)
+    if not hit:
+        score = query_abuseipdb(ip, script_name, session, api_url)
+        store_cache(conn, ip, score, script_name)
+    return score
+
+def get_reputations(ips, script_name, conn=None, workers=BATCH_WORKERS, api_url=ABUSEIPDB_API_URL):
+    """Return {ip: score} for a list of IPs, the ones not cached are looked up concurrently over one session."""
+    scores = {}
+    misses = []
+    for ip in ips:
+        hit, score = lookup_cache(conn, ip, script_name)
+        if hit:
+            scores[ip] = score
+        else:
+            misses.append(ip)
+
+    if misses:
+        with create_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(lambda ip: query_abuseipdb(ip, script_name, session, api_url), misses)
+            for ip, score in zip(misses, results):
+                scores[ip] = score
+                # The cache connection stays on this thread
+                store_cache(conn, ip, score, script_name)
+    return scores
+
+def open_cache_or_none(script_name):
+    """open_cache(), or None after logging why the cache is unavailable."""
+    try:
+        return open_cache()
+    except sqlite3.Error as e:
+        write_debug_file(script_name, f"Reputation cache unavailable: {e}")
+        return None
+
+def extract_srcip(data):
+    """Source IP of a Wazuh active-response message, empty when missing."""
+    alert = data.get("parameters", {}).get("alert", {})
+    return alert.get("data", {}).get("srcip", "")
+
+def read_batch(stream):
+    """Unique valid IPs, in order of appearance, from JSONL lines holding an alert, {"ip": ...} or an IP string."""
+    ips = {}
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(data, str):
+            ip = data
+        elif isinstance(data, dict) and "ip" in data:
+            ip = data["ip"]
+        elif isinstance(data, dict) and data.get("command", "add") == "add":
+            ip = extract_srcip(data)
+        else:
+            continue
+        # Only real addresses are worth an AbuseIPDB query
+        try:
+            ip = str(ipaddress.ip_address(ip)) if isinstance(ip, str) else None
+        except ValueError:
+            ip = None
+        if ip:
+            ips[ip] = None
+    return list(ips)
+
+def handle_reputation(srcip, reputation_score, script_name, block_queue):
+    """Log the outcome of a reputation check and queue bad IPs for blocking, returning True when queued."""
+    if reputation_score is None:
+        write_debug_file(script_name, "IP reputation check failed, please investigate")
+    elif reputation_score > REPUTATION_THRESHOLD:
+        bad_ip_msg = f"IP reputation check completed and reputation is bad. {srcip} will be blocked at the router firewall"
+        write_debug_file(script_name, bad_ip_msg)  # Write to active-responses.log
+
+        # Block the IP on the Mikrotik router via SSH
+        return block_queue.add(srcip)
+    else:
+        write_debug_file(script_name, f"IP reputation check completed and reputation is good for {srcip}")
+    return False
 
 def run_ssh_command(command):
-    """Execute the command on Mikrotik router via SSH."""
+    """Execute the command on Mikrotik router via SSH, returning True on success."""
     try:
-        cmd = [
-            "ssh",
+        cmd = SSH_COMMAND + [
             "-i", SSH_KEY_PATH,
             "-o", "StrictHostKeyChecking=no",
+            # Share one authenticated connection instead of a key exchange per command
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={SSH_CONTROL_PATH}",
+            "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
             f"wazuh@{MIKROTIK_IP}",
             command
         ]
         result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        print("Success:", result.stdout)
-    except subprocess.CalledProcessError as e:
-        print("Failed:", e.stderr)
+        print("Success:", result.stdout, file=sys.stderr)
+        return True
+    except (subprocess.CalledProcessError, OSError) as e:
+        print("Failed:", getattr(e, "stderr", e), file=sys.stderr)
+        return False
+
+class BlockQueue:
+    """Collect IPs to block and push them to the router together, as one script per BLOCK_BATCH_SIZE IPs."""
+
+    def __init__(self, script_name, batch_size=BLOCK_BATCH_SIZE):
+        self.script_name = script_name
+        self.batch_size = batch_size
+        self.pending = {}
+
+    def add(self, ip):
+        """Queue an IP, returning False when it is not a valid address."""
+        try:
+            ip = str(ipaddress.ip_address(ip))
+        except ValueError:
+            # Never let anything else than an address into the router script
+            write_debug_file(self.script_name, f"Refusing to block invalid address {ip!r}")
+            return False
+        self.pending[ip] = None
+        return True
+
+    def __len__(self):
+        return len(self.pending)
+
+    def flush(self):
+        """Block every queued IP not on the address list yet, returning the IPs whose script failed."""
+        ips = list(self.pending)
+        self.pending.clear()
+        failed = []
+        for start in range(0, len(ips), self.batch_size):
+            batch = ips[start:start + self.batch_size]
+            script = "; ".join(FIREWALL_COMMAND_IF_MISSING.format(ip=ip) for ip in batch)
+            if run_ssh_command(script):
+                write_debug_file(self.script_name, f"Blocked {len(batch)} IPs at the router firewall")
+            else:
+                write_debug_file(self.script_name, f"Blocking {len(batch)} IPs at the router firewall failed, please investigate")
+                failed.extend(batch)
+        return failed
+
+class WorkerStats:
+    """Counters and recent per-stage latencies of the worker."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.started = time.time()
+        self.counts = collections.Counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=samples))
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.latencies[stage].append(seconds)
+
+    def snapshot(self, queue_depth, block_pending):
+        """Statistics as a JSON-serializable dict, latencies in milliseconds."""
+        with self.lock:
+            latency = {}
+            for stage, samples in self.latencies.items():
+                ordered = sorted(samples)
+                latency[stage] = {
+                    "samples": len(ordered),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+                    "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 3),
+                    "max_ms": round(ordered[-1] * 1000, 3)
+                }
+            return {
+                "uptime": round(time.time() - self.started),
+                "queue_depth": queue_depth,
+                "block_pending": block_pending,
+                "counts": dict(self.counts),
+                "latency": latency
+            }
+
+class ReputationWorker:
+    """Check alerts queued by the socket server on one thread, keeping the session, cache and block queue warm.
+
+    Stages timed: "queue" from accept to pick up, "lookup" for the cache or AbuseIPDB,
+    "total" from accept to decision, and "block" for each push to the router.
+    """
+
+    def __init__(self, script_name, api_url=ABUSEIPDB_API_URL, flush_interval=WORKER_FLUSH_INTERVAL):
+        self.script_name = script_name
+        self.api_url = api_url
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.stats = WorkerStats()
+        self.block_queue = BlockQueue(script_name)
+        self.session = create_session(1)
+
+    def handle_message(self, line):
+        """Reply to one line read from the socket: queue an "add" alert or return the statistics."""
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            self.stats.count("invalid")
+            write_debug_file(self.script_name, "IP reputation check failed, please investigate")
+            return {"error": "invalid message"}
+
+        command = data.get("command", "")
+        if command == "stats":
+            return self.snapshot()
+        srcip = extract_srcip(data) if command == "add" else ""
+        if not srcip:
+            self.stats.count("invalid")
+            write_debug_file(self.script_name, "IP reputation check failed, please investigate")
+            return {"error": "expected an add command with a srcip"}
+
+        write_debug_file(self.script_name, "IP Reputation check started")
+        self.stats.count("received")
+        self.queue.put((srcip, time.monotonic()))
+        return {"queued": srcip, "queue_depth": self.queue.qsize()}
+
+    def snapshot(self):
+        return self.stats.snapshot(self.queue.qsize(), len(self.block_queue))
+
+    def stop(self):
+        """Finish the alerts already queued, then make run() return."""
+        self.queue.put(None)
+
+    def run(self):
+        # The cache connection is only used from this thread
+        conn = open_cache_or_none(self.script_name)
+        last_flush = last_stats = time.monotonic()
+        while True:
+            timeout = max(last_flush + self.flush_interval - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self.guard("check", self.check, conn, *item)
+
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval or len(self.block_queue) >= self.block_queue.batch_size:
+                self.guard("flush", self.flush)
+                last_flush = now
+            if now - last_stats >= WORKER_STATS_INTERVAL:
+                write_debug_file(self.script_name, f"Worker statistics: {json.dumps(self.snapshot())}")
+                last_stats = now
+        self.guard("flush", self.flush)
+        if conn is not None:
+            conn.close()
+        self.session.close()
+
+    def guard(self, stage, fn, *args):
+        """Run one check or flush, logging and counting an error instead of letting it end the thread."""
+        try:
+            fn(*args)
+        except Exception as e:
+            self.stats.count(f"{stage}_errors")
+            print(f"Worker {stage} failed: {e!r}", file=sys.stderr)
+            write_debug_file(self.script_name, f"Worker {stage} failed, please investigate: {e!r}")
+
+    def check(self, conn, srcip, queued_at):
+        started = time.monotonic()
+        self.stats.record("queue", started - queued_at)
+        score = get_reputation(srcip, self.script_name, conn, self.api_url, self.session)
+        self.stats.record("lookup", time.monotonic() - started)
+        self.stats.count("checked")
+        if handle_reputation(srcip, score, self.script_name, self.block_queue):
+            self.stats.count("queued_for_block")
+        self.stats.record("total", time.monotonic() - queued_at)
+
+    def flush(self):
+        """Push the IPs queued for blocking to the router, then write the buffered log lines."""
+        if len(self.block_queue):
+            pending = len(self.block_queue)
+            started = time.monotonic()
+            failed = self.block_queue.flush()
+            self.stats.record("block", time.monotonic() - started)
+            self.stats.count("blocked", pending - len(failed))
+            self.stats.count("block_failed", len(failed))
+        try:
+            LOG_WRITER.flush()
+        except OSError as e:
+            print(f"Writing {LOG_WRITER.log_file} failed: {e}", file=sys.stderr)
+
+class WorkerRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON line in, one JSON line out."""
+
+    def handle(self):
+        line = self.rfile.readline(MAX_MESSAGE_SIZE)
+        if not line.strip():
+            return  # A connection probe, such as socket_in_use() from another worker
+        reply = self.server.worker.handle_message(line)
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+def socket_in_use(path):
+    """True when another worker accepts connections on the socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(path)
+            return True
+        except OSError:
+            return False
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Check source IPs against AbuseIPDB and block bad ones on the Mikrotik router")
+    parser.add_argument("--batch", action="store_true",
+                        help="Read many alerts, {\"ip\": ...} objects or IP strings from stdin as JSONL and print one result per unique IP")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help=f"Concurrent lookups in batch mode (default: {BATCH_WORKERS})")
+    parser.add_argument("--worker", action="store_true",
+                        help="Run as a long-lived worker taking alerts from abuseipdb-client.py over a Unix socket")
+    parser.add_argument("--socket", default=WORKER_SOCKET, help=f"Worker socket path, also read from $ABUSEIPDB_WORKER_SOCKET (default: {WORKER_SOCKET})")
+    parser.add_argument("--flush-interval", type=float, default=WORKER_FLUSH_INTERVAL,
+                        help=f"Seconds between worker flushes of the log and the router block list (default: {WORKER_FLUSH_INTERVAL})")
+    parser.add_argument("--api-url", default=ABUSEIPDB_API_URL, help="AbuseIPDB check endpoint, also read from $ABUSEIPDB_API_URL")
+    return parser.parse_args(argv)
+
+def run_batch(script_name, args):
+    """Check every IP read from stdin, printing {"ip", "score", "blocked"} per IP as JSONL."""
+    ips = read_batch(sys.stdin)
+    write_debug_file(script_name, f"Batch IP reputation check started for {len(ips)} IPs")
+    scores = get_reputations(ips, script_name, open_cache_or_none(script_name), max(args.workers, 1), args.api_url)
+    block_queue = BlockQueue(script_name)
+    blocked = {ip: handle_reputation(ip, scores[ip], script_name, block_queue) for ip in ips}
+    failed = set(block_queue.flush())
+    for ip in ips:
+        print(json.dumps({"ip": ip, "score": scores[ip], "blocked": blocked[ip] and ip not in failed}), flush=True)
+
+def run_worker(script_name, args):
+    """Serve alerts on the worker socket until SIGTERM or SIGINT."""
+    global LOG_WRITER
+    if socket_in_use(args.socket):
+        print(f"A worker is already listening on {args.socket}", file=sys.stderr)
+        return OS_INVALID
+    if os.path.exists(args.socket):
+        os.remove(args.socket)  # Left behind by a worker that did not exit cleanly
+
+    LOG_WRITER = LogWriter()
+    worker = ReputationWorker(script_name, args.api_url, args.flush_interval)
+    server = socketserver.ThreadingUnixStreamServer(args.socket, WorkerRequestHandler)
+    server.daemon_threads = True
+    server.worker = worker
+    os.chmod(args.socket, 0o660)
+
+    def request_stop(signum, frame):
+        # shutdown() waits for serve_forever(), which runs on this thread
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    checker = threading.Thread(target=worker.run, name="reputation-worker")
+    checker.start()
+    write_debug_file(script_name, f"Worker listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+        worker.stop()
+        checker.join()
+        write_debug_file(script_name, f"Worker stopped: {json.dumps(worker.snapshot())}")
+        LOG_WRITER.flush()
+    return OS_SUCCESS
 
 def main(argv):
     script_name = os.path.basename(argv[0])
+    args = parse_args(argv[1:])
+    if args.batch:
+        run_batch(script_name, args)
+        sys.exit(OS_SUCCESS)
+    if args.worker:
+        sys.exit(run_worker(script_name, args))
+
     write_debug_file(script_name, "IP Reputation check started")
 
     # Read alert from STDIN
@@ -82,26 +556,18 @@ def main(argv):
         sys.exit(OS_INVALID)
 
     # Extract srcip from alert
-    alert = data.get("parameters", {}).get("alert", {})
-    srcip = alert.get("data", {}).get("srcip", "")
+    srcip = extract_srcip(data)
     if not srcip:
         write_debug_file(script_name, "IP reputation check failed, please investigate")
         sys.exit(OS_INVALID)
 
-    # Query AbuseIPDB and get the reputation score
-    reputation_score = query_abuseipdb(srcip, script_name)
+    # Query AbuseIPDB and get the reputation score, unless a recent one is cached
+    reputation_score = get_reputation(srcip, script_name, open_cache_or_none(script_name), api_url=args.api_url)
 
     # Determine the final log message based on the reputation score
-    if reputation_score is None:
-        write_debug_file(script_name, "IP reputation check failed, please investigate")
-    elif reputation_score > REPUTATION_THRESHOLD:
-        bad_ip_msg = f"IP reputation check completed and reputation is bad. {srcip} will be blocked at the router firewall"
-        write_debug_file(script_name, bad_ip_msg)  # Write to active-responses.log
-
-        # Block the IP on the Mikrotik router via SSH
-        run_ssh_command(FIREWALL_COMMAND.format(ip=srcip))
-    else:
-        write_debug_file(script_name, f"IP reputation check completed and reputation is good for {srcip}")
+    block_queue = BlockQueue(script_name)
+    handle_reputation(srcip, reputation_score, script_name, block_queue)
+    block_queue.flush()
 
     sys.exit(OS_SUCCESS)
 
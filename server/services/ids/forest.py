@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Compiled Random Forest for the AI-based IDS
+Flattens a trained scikit-learn Random Forest into plain NumPy arrays and
+evaluates it without going through sklearn's per-call validation
+"""
+
+import sys
+import os
+import json
+import numpy as np
+
+# Arrays stored as one .npy file each so they can be memory-mapped
+ARRAY_NAMES = ("feature", "threshold", "children", "value", "roots", "classes")
+
+# Scalar attributes of the forest, stored alongside the arrays
+METADATA_FILE = "forest.json"
+
+class CompiledForest:
+    """
+    Array-backed Random Forest classifier
+
+    The nodes of all trees are stored back to back. Node i tests
+    x[feature[i]] <= threshold[i] and continues at children[2 * i + 1] when
+    it holds and at children[2 * i] otherwise. Leaves point back at
+    themselves, so every tree can be walked for a fixed number of steps, and
+    value[i] holds the class probabilities of leaf i.
+    """
+
+    # Samples walked through all trees at once, small enough to stay in cache
+    TILE_SIZE = 256
+
+    def __init__(self, feature, threshold, children, value, roots, classes, depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.depth = int(depth)
+        self.n_features_in_ = int(n_features)
+
+    def predict_proba(self, X):
+        """
+        Predict class probabilities, matching RandomForestClassifier.predict_proba
+
+        Args:
+            X (ndarray): Feature matrix, one row per sample
+
+        Returns:
+            ndarray: Class probabilities, one row per sample
+        """
+        # The trees were grown on float32 features, compare at that precision
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[-1]} features, but CompiledForest is expecting "
+                f"{self.n_features_in_} features as input"
+            )
+        # NaN and infinity would silently take a branch, reject them like sklearn does
+        if not np.isfinite(X).all():
+            if np.isnan(X).any():
+                raise ValueError("Input X contains NaN.")
+            raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+
+        if X.shape[0] <= self.TILE_SIZE:
+            return self._predict_tile(X)
+        return np.concatenate([
+            self._predict_tile(X[start:start + self.TILE_SIZE])
+            for start in range(0, X.shape[0], self.TILE_SIZE)
+        ])
+
+    def _predict_tile(self, X):
+        """
+        Predict class probabilities for a small float32 feature matrix
+
+        Args:
+            X (ndarray): Feature matrix, one row per sample
+
+        Returns:
+            ndarray: Class probabilities, one row per sample
+        """
+        # Walk every tree for every sample at once, one level per step
+        flat = np.ascontiguousarray(X).ravel()
+        offsets = np.arange(X.shape[0], dtype=np.intp) * X.shape[1]
+        nodes = np.repeat(self.roots[:, np.newaxis], X.shape[0], axis=1)
+        for _ in range(self.depth):
+            go_left = flat.take(self.feature.take(nodes) + offsets) <= self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + go_left)
+
+        # Sum the trees in estimator order, like sklearn, so results are bit-identical
+        proba = np.add.accumulate(self.value.take(nodes, axis=0), axis=0)[-1]
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X):
+        """
+        Predict the class of every sample
+
+        Args:
+            X (ndarray): Feature matrix, one row per sample
+
+        Returns:
+            ndarray: Predicted class labels
+        """
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path):
+        """
+        Write the compiled forest to a directory of .npy files
+
+        Args:
+            path (str): Destination directory, created if missing
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAY_NAMES:
+            array = self.classes_ if name == "classes" else getattr(self, name)
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+
+        with open(os.path.join(path, METADATA_FILE), "w") as f:
+            json.dump({"depth": self.depth, "n_features": self.n_features_in_}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Open a compiled forest written by save()
+
+        With the default mmap_mode the arrays are memory-mapped read-only, so
+        every process using the same directory shares one copy of the pages.
+
+        Args:
+            path (str): Directory written by save()
+            mmap_mode (str): Passed to numpy.load, None reads into memory
+
+        Returns:
+            CompiledForest: The loaded forest
+        """
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(
+            arrays["feature"],
+            arrays["threshold"],
+            arrays["children"],
+            arrays["value"],
+            arrays["roots"],
+            arrays["classes"],
+            metadata["depth"],
+            metadata["n_features"]
+        )
+
+def compile_forest(model):
+    """
+    Flatten a trained RandomForestClassifier into a CompiledForest
+
+    Args:
+        model: A fitted single-output RandomForestClassifier
+
+    Returns:
+        CompiledForest: Forest giving the same probabilities as the model
+    """
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise ValueError("Only single-output forests can be compiled")
+
+    n_classes = len(model.classes_)
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count) + offset
+        leaf = tree.children_left == -1
+
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, 0.0, tree.threshold))
+        pairs = np.empty((tree.node_count, 2), dtype=np.intp)
+        pairs[:, 0] = np.where(leaf, nodes, tree.children_right + offset)
+        pairs[:, 1] = np.where(leaf, nodes, tree.children_left + offset)
+        children.append(pairs.ravel())
+
+        # Same normalization DecisionTreeClassifier.predict_proba applies
+        value = tree.value[:, 0, :n_classes].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+        values.append(value)
+
+        roots.append(offset)
+        offset += tree.node_count
+
+    return CompiledForest(
+        np.concatenate(features).astype(np.intp),
+        np.concatenate(thresholds).astype(np.float64),
+        np.concatenate(children),
+        np.concatenate(values),
+        np.array(roots, dtype=np.intp),
+        np.asarray(model.classes_),
+        max(estimator.tree_.max_depth for estimator in model.estimators_),
+        model.n_features_in_
+    )
+
+def main():
+    """
+    Export a joblib Random Forest as a compiled forest directory
+    """
+    if len(sys.argv) != 3:
+        print(f"Usage: {sys.argv[0]} MODEL.joblib OUTPUT_DIR", file=sys.stderr)
+        sys.exit(1)
+
+    import joblib
+
+    forest = compile_forest(joblib.load(sys.argv[1]))
+    forest.save(sys.argv[2])
+    print(f"Compiled {len(forest.roots)} trees ({len(forest.feature)} nodes) to {sys.argv[2]}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import { spawn } from 'child_process';
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
 import path from 'path';
 import { fileURLToPath } from 'url';
 import { logger } from '../../logger';
@@ -41,12 +41,21 @@ interface NetworkActivityClassification {
   error?: string;
 }
 
+// Yêu cầu đang chờ phản hồi từ worker Python
+interface PendingRequest {
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+}
+
 /**
  * Adapter để kết nối với bộ phân tích OpenAI thông qua Python script
  */
 export class OpenAIIDSAdapter {
   private pythonPath: string;
   private scriptPath: string;
+  private worker: ChildProcessWithoutNullStreams | null = null;
+  private pending = new Map<number, PendingRequest>();
+  private nextRequestId = 1;
 
   constructor() {
     // Đường dẫn đến Python script
@@ -60,80 +69,115 @@ export class OpenAIIDSAdapter {
   }
 
   /**
-   * Thực thi lệnh Python với dữ liệu đầu vào 
+   * Khởi động worker Python (một lần cho mỗi tiến trình) hoặc trả về worker đang chạy.
+   * Worker đọc yêu cầu JSON từng dòng từ stdin và trả lời theo "id" qua stdout.
+   */
+  private getWorker(): ChildProcessWithoutNullStreams {
+    if (this.worker) {
+      return this.worker;
+    }
+
+    const worker = spawn(this.pythonPath, [this.scriptPath]);
+    let buffered = '';
+
+    worker.stdout.setEncoding('utf8');
+    worker.stdout.on('data', (chunk: string) => {
+      buffered += chunk;
+      let newline: number;
+      while ((newline = buffered.indexOf('\n')) >= 0) {
+        const line = buffered.slice(0, newline);
+        buffered = buffered.slice(newline + 1);
+        if (line.trim()) {
+          this.handleWorkerLine(line);
+        }
+      }
+    });
+
+    worker.stderr.on('data', (data) => {
+      logger.error(`OpenAI analyzer: ${data.toString().trim()}`);
+    });
+
+    // Lỗi ghi stdin (worker đã thoát) được xử lý qua sự kiện exit
+    worker.stdin.on('error', () => {});
+
+    const onWorkerExit = (reason: string) => {
+      if (this.worker !== worker) {
+        return;
+      }
+      this.worker = null;
+      logger.error(`OpenAI analyzer worker stopped: ${reason}`);
+      const pending = Array.from(this.pending.values());
+      this.pending.clear();
+      for (const request of pending) {
+        request.reject(new Error(`Python process failed: ${reason}`));
+      }
+    };
+    worker.on('exit', (code, signal) => onWorkerExit(`exited with code ${code}${signal ? `, signal ${signal}` : ''}`));
+    worker.on('error', (error) => onWorkerExit(error.message));
+
+    this.worker = worker;
+    logger.info(`OpenAI analyzer worker started (pid ${worker.pid})`);
+    return worker;
+  }
+
+  /**
+   * Chuyển phản hồi của worker cho yêu cầu có cùng id
+   */
+  private handleWorkerLine(line: string): void {
+    let response: { id: number; result?: any; error?: string };
+    try {
+      response = JSON.parse(line);
+    } catch (error) {
+      logger.error(`Failed to parse Python output: ${line}`);
+      return;
+    }
+
+    const request = this.pending.get(response.id);
+    if (!request) {
+      logger.error(`Unexpected response from OpenAI analyzer worker: ${line}`);
+      return;
+    }
+    this.pending.delete(response.id);
+    if (this.pending.size === 0 && this.worker) {
+      this.setWorkerRef(this.worker, false);
+    }
+
+    if (response.error !== undefined) {
+      request.reject(new Error(`Python process failed: ${response.error}`));
+    } else {
+      request.resolve(response.result);
+    }
+  }
+
+  /**
+   * Worker rảnh không giữ Node.js chạy, để các script ngắn vẫn thoát được
+   */
+  private setWorkerRef(worker: ChildProcessWithoutNullStreams, active: boolean): void {
+    for (const handle of [worker, worker.stdin, worker.stdout, worker.stderr] as any[]) {
+      if (active) {
+        handle.ref?.();
+      } else {
+        handle.unref?.();
+      }
+    }
+  }
+
+  /**
+   * Gửi yêu cầu đến worker Python và chờ kết quả.
+   * Nhiều yêu cầu có thể chạy đồng thời trên cùng một worker.
    */
   private async executePythonScript(functionName: string, data: any): Promise<any> {
     return new Promise((resolve, reject) => {
-      // Chuẩn bị dữ liệu đầu vào
-      const inputData = JSON.stringify({
+      const worker = this.getWorker();
+      const id = this.nextRequestId++;
+
+      this.pending.set(id, { resolve, reject });
+      this.setWorkerRef(worker, true);
+      worker.stdin.write(JSON.stringify({
+        id,
         function: functionName,
         data: data
-      });
-
-      // Tạo child process để chạy Python script
-      const pythonProcess = spawn(this.pythonPath, ['-c', `
-import sys
-import json
-import asyncio
-sys.path.append('${path.dirname(this.scriptPath)}')
-from openai_analyzer import create_openai_analyzer
-
-async def main():
-    input_data = json.loads('''${inputData}''')
-    analyzer = create_openai_analyzer()
-    if not analyzer:
-        print(json.dumps({"error": "Failed to create OpenAI analyzer"}))
-        return
-    
-    function_name = input_data['function']
-    data = input_data['data']
-    
-    if function_name == 'analyze_traffic_patterns':
-        result = await analyzer.analyze_traffic_patterns(data)
-    elif function_name == 'classify_network_activity':
-        result = await analyzer.classify_network_activity(data)
-    elif function_name == 'analyze_packet_capture':
-        result = await analyzer.analyze_packet_capture(data)
-    elif function_name == 'generate_threat_report':
-        result = await analyzer.generate_threat_report(data)
-    else:
-        result = {"error": f"Unknown function: {function_name}"}
-    
-    print(json.dumps(result))
-
-if __name__ == "__main__":
-    asyncio.run(main())
-      `]);
-
-      let stdout = '';
-      let stderr = '';
-
-      // Lắng nghe output từ Python script
-      pythonProcess.stdout.on('data', (data) => {
-        stdout += data.toString();
-      });
-
-      pythonProcess.stderr.on('data', (data) => {
-        stderr += data.toString();
-      });
-
-      // Xử lý kết quả
-      pythonProcess.on('close', (code) => {
-        if (code !== 0) {
-          logger.error(`Python process exited with code ${code}`);
-          logger.error(`Error: ${stderr}`);
-          reject(new Error(`Python process failed: ${stderr}`));
-          return;
-        }
-
-        try {
-          const result = JSON.parse(stdout);
-          resolve(result);
-        } catch (error) {
-          logger.error(`Failed to parse Python output: ${stdout}`);
-          reject(new Error(`Failed to parse Python output: ${error.message}`));
-        }
-      });
+      }) + '\n');
     });
   }
 
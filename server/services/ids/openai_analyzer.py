@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import sys
@@ -5,23 +6,41 @@ from typing import Dict, List, Any, Optional, Tuple
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Cấu hình OpenAI API
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     print("OPENAI_API_KEY not found in environment variables", file=sys.stderr)
 
-openai = OpenAI(api_key=OPENAI_API_KEY)
+# OPENAI_BASE_URL cho phép trỏ đến một máy chủ giả lập API khi kiểm thử
+openai = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+# Số lời gọi OpenAI API chạy đồng thời tối đa
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", "8"))
+# Thời gian tối đa (giây) cho mỗi lời gọi OpenAI API
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+# Độ dài tối đa của một dòng yêu cầu trên stdin
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+ANALYZER_FUNCTIONS = (
+    "analyze_traffic_patterns",
+    "classify_network_activity",
+    "analyze_packet_capture",
+    "generate_threat_report",
+)
 
 class OpenAINetworkAnalyzer:
     """
     Sử dụng OpenAI API để phân tích dữ liệu mạng và phát hiện các hoạt động bất thường
     """
     
-    def __init__(self):
+    def __init__(self, max_concurrency: int = OPENAI_MAX_CONCURRENCY, timeout: float = OPENAI_TIMEOUT):
         if not OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY không được cấu hình")
+
+        # Giới hạn số lời gọi API đồng thời và thời gian chờ mỗi lời gọi
+        self.semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        self.timeout = timeout
         
         # Khởi tạo bộ phân tích với các mẫu tấn công phổ biến
         self.attack_patterns = {
@@ -32,6 +51,36 @@ class OpenAINetworkAnalyzer:
             "malware_c2": "Kết nối đều đặn đến địa chỉ IP không xác định với mẫu thời gian cố định"
         }
     
+    async def _complete_json(self, system_prompt: str, prompt: str) -> Dict[str, Any]:
+        """
+        Gọi OpenAI API (không chặn event loop) và trả về nội dung phản hồi JSON
+        """
+        async with self.semaphore:
+            try:
+                response = await asyncio.wait_for(
+                    openai.chat.completions.create(
+                        model="gpt-4o",
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": prompt}
+                        ],
+                        response_format={"type": "json_object"}
+                    ),
+                    self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"OpenAI API không phản hồi sau {self.timeout} giây")
+        return json.loads(response.choices[0].message.content)
+
+    async def analyze_batch(self, items: List[Any], function_name: str = "analyze_traffic_patterns") -> List[Dict[str, Any]]:
+        """
+        Phân tích nhiều mục song song bằng một phương thức phân tích, kết quả theo thứ tự đầu vào
+        """
+        if function_name not in ANALYZER_FUNCTIONS:
+            raise ValueError(f"Unknown function: {function_name}")
+        method = getattr(self, function_name)
+        return await asyncio.gather(*(method(item) for item in items))
+
     async def analyze_traffic_patterns(self, traffic_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Phân tích mẫu lưu lượng mạng bằng OpenAI API để phát hiện bất thường
@@ -41,18 +90,11 @@ class OpenAINetworkAnalyzer:
         
         try:
             # Gọi OpenAI API để phân tích
-            response = openai.chat.completions.create(
-                model="gpt-4o", 
-                messages=[
-                    {"role": "system", "content": "Bạn là chuyên gia phân tích bảo mật mạng. Nhiệm vụ của bạn là phân tích dữ liệu mạng để phát hiện các hoạt động bất thường hoặc độc hại. Trả về kết quả phân tích chi tiết, bao gồm mức độ tin cậy và loại bất thường nếu có. Phản hồi là JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
+            analysis_result = await self._complete_json(
+                "Bạn là chuyên gia phân tích bảo mật mạng. Nhiệm vụ của bạn là phân tích dữ liệu mạng để phát hiện các hoạt động bất thường hoặc độc hại. Trả về kết quả phân tích chi tiết, bao gồm mức độ tin cậy và loại bất thường nếu có. Phản hồi là JSON.",
+                prompt
             )
             
-            # Phân tích kết quả trả về
-            analysis_result = json.loads(response.choices[0].message.content)
-            
             # Thêm thông tin phiên bản mô hình và timestamp
             analysis_result["model_version"] = "gpt-4o"
             
@@ -90,16 +132,10 @@ class OpenAINetworkAnalyzer:
             {{"classification": string, "anomaly_detected": boolean, "pattern_description": string, "severity": string, "recommended_action": string, "confidence": number}}
             """
             
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "Bạn là chuyên gia phân tích bảo mật mạng chuyên phát hiện các hoạt động bất thường. Hãy trả về phân tích chính xác dưới dạng JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
+            result = await self._complete_json(
+                "Bạn là chuyên gia phân tích bảo mật mạng chuyên phát hiện các hoạt động bất thường. Hãy trả về phân tích chính xác dưới dạng JSON.",
+                prompt
             )
-            
-            result = json.loads(response.choices[0].message.content)
             return result
             
         except Exception as e:
@@ -135,16 +171,10 @@ class OpenAINetworkAnalyzer:
             Trả về kết quả là JSON
             """
             
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "Bạn là chuyên gia phân tích dữ liệu gói tin mạng chuyên sâu. Hãy cung cấp phân tích chi tiết dưới dạng JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
+            result = await self._complete_json(
+                "Bạn là chuyên gia phân tích dữ liệu gói tin mạng chuyên sâu. Hãy cung cấp phân tích chi tiết dưới dạng JSON.",
+                prompt
             )
-            
-            result = json.loads(response.choices[0].message.content)
             return result
             
         except Exception as e:
@@ -175,16 +205,10 @@ class OpenAINetworkAnalyzer:
             Trả về báo cáo dưới dạng JSON với các trường: summary, risk_level, detailed_findings, remediation_steps, prevention_guidance
             """
             
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "Bạn là chuyên gia phân tích đe dọa bảo mật mạng. Tạo báo cáo đe dọa chuyên nghiệp dưới dạng JSON."},
-                    {"role": "user", "content": report_prompt}
-                ],
-                response_format={"type": "json_object"}
+            report = await self._complete_json(
+                "Bạn là chuyên gia phân tích đe dọa bảo mật mạng. Tạo báo cáo đe dọa chuyên nghiệp dưới dạng JSON.",
+                report_prompt
             )
-            
-            report = json.loads(response.choices[0].message.content)
             return report
             
         except Exception as e:
@@ -259,9 +283,67 @@ class OpenAINetworkAnalyzer:
         return json.dumps(summary, indent=2)
 
 # Hàm để khởi tạo trình phân tích OpenAI
-def create_openai_analyzer() -> Optional[OpenAINetworkAnalyzer]:
+def create_openai_analyzer(max_concurrency: int = OPENAI_MAX_CONCURRENCY, timeout: float = OPENAI_TIMEOUT) -> Optional[OpenAINetworkAnalyzer]:
     try:
-        return OpenAINetworkAnalyzer()
+        return OpenAINetworkAnalyzer(max_concurrency, timeout)
     except Exception as e:
         print(f"Error creating OpenAI Network Analyzer: {str(e)}", file=sys.stderr)
-        return None
\ No newline at end of file
+        return None
+
+async def handle_request(analyzer: Optional[OpenAINetworkAnalyzer], request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Xử lý một yêu cầu {"id", "function", "data"} và trả về {"id", "result"}
+    """
+    function_name = request.get("function")
+    if not analyzer:
+        result = {"error": "Failed to create OpenAI analyzer"}
+    elif function_name not in ANALYZER_FUNCTIONS:
+        result = {"error": f"Unknown function: {function_name}"}
+    else:
+        result = await getattr(analyzer, function_name)(request.get("data"))
+    return {"id": request.get("id"), "result": result}
+
+async def serve_stdio() -> None:
+    """
+    Worker dùng lâu dài: đọc yêu cầu JSON từng dòng từ stdin, trả lời từng dòng ra stdout
+    theo thứ tự hoàn thành, ghép cặp bằng "id". Client OpenAI và bộ phân tích chỉ được tạo một lần,
+    số lời gọi API đồng thời do semaphore của bộ phân tích giới hạn.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_REQUEST_SIZE)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    analyzer = create_openai_analyzer()
+
+    def respond(response: Dict[str, Any]) -> None:
+        # Chỉ ghi từ event loop nên các dòng không bị xen kẽ
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+    async def run(request: Dict[str, Any]) -> None:
+        try:
+            respond(await handle_request(analyzer, request))
+        except Exception as e:
+            print(f"Error handling request {request.get('id')}: {str(e)}", file=sys.stderr)
+            respond({"id": request.get("id"), "error": str(e)})
+
+    tasks = set()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            request = str(e)
+        if not isinstance(request, dict):
+            print(f"Invalid request: {request}", file=sys.stderr)
+            continue
+        task = asyncio.create_task(run(request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    # stdin đóng: hoàn tất các yêu cầu đang chạy rồi thoát
+    await asyncio.gather(*tasks)
+
+if __name__ == "__main__":
+    asyncio.run(serve_stdio())
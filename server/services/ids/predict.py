@@ -5,44 +5,231 @@ This script loads the model and makes predictions based on network traffic featu
 """
 
 import sys
+import os
 import json
-import joblib
+import argparse
+import collections
+import csv
+import functools
+import itertools
+import multiprocessing
+import socket
+import shutil
+import socketserver
+import tempfile
+import time
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-import pandas as pd
+from forest import CompiledForest, compile_forest
 
-def load_model(model_path="rf_model.joblib"):
+# Feature columns expected by the model, in training order
+REQUIRED_FEATURES = [
+    'Destination Port', 'Flow Duration', 'Total Fwd Packets',
+    'Total Backward Packets', 'Total Length of Fwd Packets',
+    'Total Length of Bwd Packets', 'Fwd Packet Length Max',
+    'Fwd Packet Length Min', 'Fwd Packet Length Mean',
+    'Fwd Packet Length Std', 'Bwd Packet Length Max',
+    'Bwd Packet Length Min', 'Bwd Packet Length Mean',
+    'Bwd Packet Length Std', 'Flow Bytes/s', 'Flow Packets/s',
+    'Flow IAT Mean', 'Flow IAT Std', 'Flow IAT Max', 'Flow IAT Min',
+    'Fwd IAT Total', 'Fwd IAT Mean', 'Fwd IAT Std', 'Fwd IAT Max',
+    'Fwd IAT Min', 'Bwd IAT Total', 'Bwd IAT Mean', 'Bwd IAT Std',
+    'Bwd IAT Max', 'Bwd IAT Min', 'Fwd PSH Flags', 'Bwd PSH Flags',
+    'Fwd URG Flags', 'Bwd URG Flags', 'Fwd Header Length',
+    'Bwd Header Length', 'Fwd Packets/s', 'Bwd Packets/s',
+    'Min Packet Length', 'Max Packet Length', 'Packet Length Mean',
+    'Packet Length Std', 'Packet Length Variance', 'FIN Flag Count',
+    'SYN Flag Count', 'RST Flag Count', 'PSH Flag Count',
+    'ACK Flag Count', 'URG Flag Count', 'CWE Flag Count',
+    'ECE Flag Count', 'Down/Up Ratio', 'Average Packet Size',
+    'Avg Fwd Segment Size', 'Avg Bwd Segment Size'
+]
+
+# Column of every required feature, used to fill feature buffers directly
+FEATURE_INDEX = {feature: index for index, feature in enumerate(REQUIRED_FEATURES)}
+
+# Number of records scored per predict_proba call in batch mode
+BATCH_SIZE = 10000
+
+# Chunks queued per worker in bulk mode, bounds memory while keeping workers busy
+PENDING_CHUNKS_PER_WORKER = 2
+
+# Seconds between progress reports in bulk mode
+PROGRESS_INTERVAL = 1.0
+
+# Fill NumPy buffers directly instead of building a pandas DataFrame per record
+FAST_PATH = True
+
+# Environment variable overriding the model location
+MODEL_PATH_ENV = "IDS_MODEL_PATH"
+
+# Model shipped with the server, relative to this script
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "assets", "rf_model.joblib"
+)
+
+# Compiled copy of a joblib model, written next to it on first load
+COMPILED_SUFFIX = ".forest"
+
+# Size and mtime of the joblib file a compiled copy was made from
+SOURCE_FILE = "source.json"
+
+# Models already loaded by this process, keyed by resolved path
+_loaded_models = {}
+
+# Model and input layout of a bulk scoring worker process
+_worker_state = {}
+
+@functools.lru_cache(maxsize=None)
+def resolve_model_path(model_path=None):
+    """
+    Work out which model file to load
+    
+    Args:
+        model_path (str): Explicit path, takes precedence over the
+            IDS_MODEL_PATH environment variable and the bundled model
+        
+    Returns:
+        str: Absolute path of the model file or compiled forest directory
+    """
+    path = model_path or os.environ.get(MODEL_PATH_ENV) or DEFAULT_MODEL_PATH
+    return os.path.abspath(path)
+
+def load_model(model_path=None):
     """
     Load the trained Random Forest model
     
+    A directory written by forest.py is memory-mapped, so predictor workers
+    share its pages and start without unpickling anything. A joblib file is
+    unpickled and compiled only the first time: the compiled forest is saved
+    to a .forest directory next to it and memory-mapped from there afterwards.
+    
     Args:
-        model_path (str): Path to the trained model file
+        model_path (str): Path to the trained model file or compiled forest
         
     Returns:
-        The loaded model
+        The loaded model, flattened into a CompiledForest when possible
     """
+    path = resolve_model_path(model_path)
+    if path in _loaded_models:
+        return _loaded_models[path]
+    
     try:
-        # Try multiple possible paths for the model file
-        possible_paths = [
-            model_path,
-            "./server/assets/rf_model.joblib",
-            "./attached_assets/rf_model.joblib"
-        ]
-        
-        for path in possible_paths:
-            try:
-                model = joblib.load(path)
-                print(f"Successfully loaded model from {path}", file=sys.stderr)
-                return model
-            except Exception as e:
-                print(f"Failed to load model from {path}: {str(e)}", file=sys.stderr)
-                continue
-                
-        print("Could not load model from any path", file=sys.stderr)
-        return None
+        if os.path.isdir(path):
+            model = CompiledForest.load(path)
+        else:
+            model = load_compiled_copy(path)
+            if model is None:
+                import joblib
+                model = compile_model(joblib.load(path))
+                if isinstance(model, CompiledForest):
+                    model = save_compiled_copy(path, model)
     except Exception as e:
-        print(f"Error loading model: {str(e)}", file=sys.stderr)
+        print(f"Error loading model from {path}: {str(e)}", file=sys.stderr)
         return None
+    
+    _loaded_models[path] = model
+    return model
+
+def compiled_copy_path(path):
+    """
+    Directory the compiled copy of a joblib model is kept in
+    
+    Args:
+        path (str): Path of the joblib model
+        
+    Returns:
+        str: The model path with its extension replaced by .forest
+    """
+    return os.path.splitext(path)[0] + COMPILED_SUFFIX
+
+def source_stamp(path):
+    """
+    Identify the version of a joblib model by its size and mtime
+    
+    Args:
+        path (str): Path of the joblib model
+        
+    Returns:
+        dict: Stamp stored with the compiled copy
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def load_compiled_copy(path):
+    """
+    Memory-map the compiled copy of a joblib model if it is up to date
+    
+    Args:
+        path (str): Path of the joblib model
+        
+    Returns:
+        CompiledForest: The compiled copy, or None when it is missing or stale
+    """
+    directory = compiled_copy_path(path)
+    try:
+        with open(os.path.join(directory, SOURCE_FILE)) as f:
+            if json.load(f) != source_stamp(path):
+                return None
+        return CompiledForest.load(directory)
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_compiled_copy(path, forest):
+    """
+    Save a freshly compiled joblib model next to it for later processes
+    
+    The copy is written to a temporary directory and renamed into place, so
+    concurrent workers never see a partial copy. When the copy cannot be
+    written the in-memory forest is used as is.
+    
+    Args:
+        path (str): Path of the joblib model
+        forest (CompiledForest): The model compiled from it
+        
+    Returns:
+        CompiledForest: The memory-mapped copy, or forest when saving failed
+    """
+    directory = compiled_copy_path(path)
+    tmp = None
+    try:
+        tmp = tempfile.mkdtemp(prefix=".forest-", dir=os.path.dirname(directory))
+        forest.save(tmp)
+        with open(os.path.join(tmp, SOURCE_FILE), "w") as f:
+            json.dump(source_stamp(path), f)
+        
+        # Another process may have saved it in the meantime, then keep theirs
+        copy = load_compiled_copy(path)
+        if copy is not None:
+            return copy
+        if os.path.exists(directory):
+            stale = tmp + ".stale"
+            os.rename(directory, stale)
+            shutil.rmtree(stale, ignore_errors=True)
+        os.rename(tmp, directory)
+        tmp = None
+        return load_compiled_copy(path) or forest
+    except OSError as e:
+        print(f"Could not save compiled model to {directory}: {str(e)}", file=sys.stderr)
+        return load_compiled_copy(path) or forest
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+def compile_model(model):
+    """
+    Flatten a loaded forest for faster inference, keeping it if that fails
+    
+    Args:
+        model: The loaded model
+        
+    Returns:
+        A CompiledForest with identical probabilities, or the model itself
+    """
+    try:
+        return compile_forest(model)
+    except Exception as e:
+        print(f"Could not compile model, using it as is: {str(e)}", file=sys.stderr)
+        return model
 
 def preprocess_features(features):
     """
@@ -55,125 +242,725 @@ def preprocess_features(features):
         DataFrame with properly formatted features
     """
     try:
+        # pandas is only needed when the fast path is disabled
+        import pandas as pd
+        
         # Convert to a pandas DataFrame (1 row)
         df = pd.DataFrame([features])
         
-        # Make sure all required features are present
-        required_features = [
-            'Destination Port', 'Flow Duration', 'Total Fwd Packets',
-            'Total Backward Packets', 'Total Length of Fwd Packets',
-            'Total Length of Bwd Packets', 'Fwd Packet Length Max',
-            'Fwd Packet Length Min', 'Fwd Packet Length Mean',
-            'Fwd Packet Length Std', 'Bwd Packet Length Max',
-            'Bwd Packet Length Min', 'Bwd Packet Length Mean',
-            'Bwd Packet Length Std', 'Flow Bytes/s', 'Flow Packets/s',
-            'Flow IAT Mean', 'Flow IAT Std', 'Flow IAT Max', 'Flow IAT Min',
-            'Fwd IAT Total', 'Fwd IAT Mean', 'Fwd IAT Std', 'Fwd IAT Max',
-            'Fwd IAT Min', 'Bwd IAT Total', 'Bwd IAT Mean', 'Bwd IAT Std',
-            'Bwd IAT Max', 'Bwd IAT Min', 'Fwd PSH Flags', 'Bwd PSH Flags',
-            'Fwd URG Flags', 'Bwd URG Flags', 'Fwd Header Length',
-            'Bwd Header Length', 'Fwd Packets/s', 'Bwd Packets/s',
-            'Min Packet Length', 'Max Packet Length', 'Packet Length Mean',
-            'Packet Length Std', 'Packet Length Variance', 'FIN Flag Count',
-            'SYN Flag Count', 'RST Flag Count', 'PSH Flag Count',
-            'ACK Flag Count', 'URG Flag Count', 'CWE Flag Count',
-            'ECE Flag Count', 'Down/Up Ratio', 'Average Packet Size',
-            'Avg Fwd Segment Size', 'Avg Bwd Segment Size'
-        ]
-        
-        # Fill missing columns with default values
-        for feature in required_features:
+        # Make sure all required features are present,
+        # filling missing columns with default values
+        for feature in REQUIRED_FEATURES:
             if feature not in df.columns:
                 df[feature] = 0
                 
         # Ensure columns are in the right order
-        df = df[required_features]
+        df = df[REQUIRED_FEATURES]
         
         return df
     except Exception as e:
         print(f"Error preprocessing features: {str(e)}", file=sys.stderr)
         return None
 
+def vectorize_features(features, out=None):
+    """
+    Fill a feature buffer directly from a record, without pandas
+    
+    Args:
+        features (dict): Dictionary containing feature values
+        out (ndarray): Preallocated (1, len(REQUIRED_FEATURES)) buffer to
+            reuse, a new float32 buffer is allocated if omitted
+        
+    Returns:
+        ndarray with the features in REQUIRED_FEATURES order, missing
+        features set to 0
+    """
+    if out is None:
+        out = np.zeros((1, len(REQUIRED_FEATURES)), dtype=np.float32)
+    else:
+        out.fill(0)
+    
+    try:
+        fill_row(out[0], features)
+        return out
+    except (TypeError, ValueError) as e:
+        print(f"Error preprocessing features: {str(e)}", file=sys.stderr)
+        return None
+
+def fill_row(row, features):
+    """
+    Copy the known features of a record into a feature row
+    
+    Args:
+        row (ndarray): Zeroed row in REQUIRED_FEATURES order
+        features (dict): Dictionary containing feature values
+    """
+    for feature, value in features.items():
+        index = FEATURE_INDEX.get(feature)
+        if index is not None and value is not None:
+            row[index] = value
+
+def error_result(message):
+    """
+    Build the result returned when a record could not be scored
+    
+    Args:
+        message (str): Description of the failure
+        
+    Returns:
+        dict: Result with the same keys as a successful prediction plus error
+    """
+    return {
+        "is_anomaly": False,
+        "probability": 0.0,
+        "error": message
+    }
+
+def proba_results(model, probs):
+    """
+    Turn predict_proba output into prediction results
+    
+    Args:
+        model: The trained model
+        probs (ndarray): Class probabilities, one row per record
+        
+    Returns:
+        list: Prediction result with class and probability for every row
+    """
+    predictions = model.classes_[probs.argmax(axis=1)]
+    anomalies = predictions == 1
+    probabilities = np.where(anomalies, probs[:, 1], probs[:, 0])
+    return [
+        {
+            "is_anomaly": bool(is_anomaly),
+            "probability": float(probability)
+        }
+        for is_anomaly, probability in zip(anomalies, probabilities)
+    ]
+
 def predict(model, features):
     """
     Make a prediction using the trained model
     
     Args:
         model: The trained model
-        features (DataFrame): Preprocessed features
+        features (DataFrame or ndarray): Preprocessed features
         
     Returns:
         dict: Prediction result with class and probability
     """
     try:
-        # Make prediction
-        prediction = model.predict(features)[0]
+        # A single predict_proba call gives both the class and its probability
+        return proba_results(model, model.predict_proba(features))[0]
+    except Exception as e:
+        print(f"Error making prediction: {str(e)}", file=sys.stderr)
+        return error_result(str(e))
+
+def score_record(model, features, buffer=None):
+    """
+    Preprocess and score a single feature record
+    
+    Args:
+        model: The trained model
+        features (dict): Dictionary containing feature values
+        buffer (ndarray): Feature buffer reused by the fast path
         
-        # Get probability
-        probs = model.predict_proba(features)[0]
-        probability = probs[1] if prediction == 1 else probs[0]
+    Returns:
+        dict: Prediction result with class and probability
+    """
+    if not isinstance(features, dict):
+        return error_result("Features must be a JSON object")
+    
+    if FAST_PATH:
+        processed_features = vectorize_features(features, buffer)
+    else:
+        processed_features = preprocess_features(features)
+    if processed_features is None:
+        return error_result("Failed to preprocess features")
+    
+    return predict(model, processed_features)
+
+def features_matrix(records):
+    """
+    Build one feature matrix for a batch of records
+    
+    Args:
+        records (list): Dictionaries containing feature values
         
-        return {
-            "is_anomaly": bool(prediction == 1),
-            "probability": float(probability)
-        }
+    Returns:
+        tuple: (matrix, errors) where matrix has one row per record in
+        REQUIRED_FEATURES order and errors maps row indexes that could not
+        be converted to an error message
+    """
+    matrix = np.zeros((len(records), len(REQUIRED_FEATURES)))
+    errors = {}
+    
+    for row, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors[row] = "Features must be a JSON object"
+            continue
+        try:
+            fill_row(matrix[row], record)
+        except (TypeError, ValueError) as e:
+            errors[row] = str(e)
+    
+    return matrix, check_finite(matrix, errors)
+
+def check_finite(matrix, errors):
+    """
+    Flag the rows of a feature matrix the model cannot score
+    
+    Args:
+        matrix (ndarray): Feature matrix in REQUIRED_FEATURES order
+        errors (dict): Row index to error message, updated in place
+        
+    Returns:
+        dict: The updated errors
+    """
+    # The trees compare float32 values, anything outside that range is rejected
+    finite = (np.abs(matrix) <= np.finfo(np.float32).max).all(axis=1)
+    for row in np.flatnonzero(~finite):
+        errors.setdefault(int(row), "Feature values must be finite")
+    return errors
+
+def predict_batch(model, records):
+    """
+    Score a batch of feature records with a single predict_proba call
+    
+    Args:
+        model: The trained model
+        records (list): Dictionaries containing feature values
+        
+    Returns:
+        list: One prediction result per input record, in input order
+    """
+    return predict_matrix(model, *features_matrix(records))
+
+def predict_matrix(model, matrix, errors):
+    """
+    Score the rows of a feature matrix with a single predict_proba call
+    
+    Args:
+        model: The trained model
+        matrix (ndarray): Feature matrix in REQUIRED_FEATURES order
+        errors (dict): Row index to error message for rows to skip
+        
+    Returns:
+        list: One prediction result per row, in row order
+    """
+    valid = np.ones(len(matrix), dtype=bool)
+    valid[list(errors)] = False
+    
+    results = [None] * len(matrix)
+    if valid.any():
+        try:
+            scored = proba_results(model, model.predict_proba(matrix[valid]))
+        except Exception as e:
+            print(f"Error making batch prediction: {str(e)}", file=sys.stderr)
+            scored = [error_result(str(e))] * int(valid.sum())
+        for row, result in zip(np.flatnonzero(valid), scored):
+            results[row] = result
+    
+    for row, message in errors.items():
+        results[row] = error_result(message)
+    
+    return results
+
+def detect_format(path):
+    """
+    Guess the format of a flow file from its extension
+    
+    Args:
+        path (str): File name
+        
+    Returns:
+        str: "json", "csv", "parquet" or "jsonl"
+    """
+    extension = os.path.splitext(path)[1].lower()
+    return {".json": "json", ".csv": "csv", ".parquet": "parquet"}.get(extension, "jsonl")
+
+def parse_json_record(line):
+    """
+    Parse one line of a JSON lines file
+    
+    Args:
+        line (str): JSON encoded feature record
+        
+    Returns:
+        The decoded record, None if the line is not valid JSON
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def parse_lines(lines, input_format, header=None):
+    """
+    Turn raw JSON lines or CSV rows into feature records
+    
+    Args:
+        lines (list): Raw lines read from the input file
+        input_format (str): "jsonl" or "csv"
+        header (list): Stripped CSV column names
+        
+    Returns:
+        list: One feature record per non-empty line
+    """
+    if input_format == "csv":
+        return [dict(zip(header, row)) for row in csv.reader(lines) if row]
+    return [parse_json_record(line) for line in lines if line.strip()]
+
+def iter_records(path, input_format=None):
+    """
+    Read feature records from a JSON array, JSON lines or CSV file
+    
+    Args:
+        path (str): File to read, "-" for stdin
+        input_format (str): "json", "jsonl" or "csv", guessed from the
+            file extension when omitted
+        
+    Yields:
+        dict: One feature record per input row, None for unparsable lines
+    """
+    input_format = input_format or detect_format(path)
+    if input_format == "parquet":
+        raise ValueError("Parquet input is only supported in --bulk mode")
+    
+    stream = sys.stdin if path == "-" else open(path, newline="")
+    try:
+        if input_format == "json":
+            data = json.load(stream)
+            yield from (data if isinstance(data, list) else [data])
+        elif input_format == "csv":
+            reader = csv.reader(stream)
+            # Flow exports often pad column names with spaces
+            header = [name.strip() for name in next(reader, [])]
+            for row in reader:
+                if row:
+                    yield dict(zip(header, row))
+        else:
+            for line in stream:
+                if line.strip():
+                    yield parse_json_record(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def score_file(model, path, outfile, input_format=None, batch_size=BATCH_SIZE):
+    """
+    Score every record of a file, writing one JSON result per line
+    
+    Args:
+        model: The trained model
+        path (str): File to read, "-" for stdin
+        outfile: Text stream the results are written to
+        input_format (str): "json", "jsonl" or "csv"
+        batch_size (int): Number of records per predict_proba call
+    """
+    records = iter_records(path, input_format)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            break
+        for result in predict_batch(model, batch):
+            outfile.write(json.dumps(result) + "\n")
+    outfile.flush()
+
+def open_bulk_input(path, input_format, chunk_size):
+    """
+    Open a large flow file for chunked reading
+    
+    CSV and JSON lines files are handed out as chunks of raw lines so the
+    workers do the parsing; CSV fields must therefore not contain newlines.
+    Parquet files (which need pyarrow) are read into feature matrices.
+    
+    Args:
+        path (str): File to read
+        input_format (str): "csv", "jsonl" or "parquet"
+        chunk_size (int): Number of rows per chunk
+        
+    Returns:
+        tuple: (header, chunks) with the stripped CSV column names (None
+        for other formats) and an iterator over the chunks
+    """
+    if input_format == "parquet":
+        return None, iter_parquet_chunks(path, chunk_size)
+    if input_format not in ("csv", "jsonl"):
+        raise ValueError(f"Unsupported input format for --bulk: {input_format}")
+    
+    stream = open(path, newline="")
+    header = None
+    if input_format == "csv":
+        header = [name.strip() for name in next(csv.reader([stream.readline()]), [])]
+    
+    def chunks():
+        with stream:
+            while True:
+                lines = list(itertools.islice(stream, chunk_size))
+                if not lines:
+                    return
+                yield lines
+    
+    return header, chunks()
+
+def iter_parquet_chunks(path, chunk_size):
+    """
+    Read a Parquet flow file as feature matrices
+    
+    Args:
+        path (str): File to read
+        chunk_size (int): Number of rows per matrix
+        
+    Yields:
+        ndarray: Feature matrix in REQUIRED_FEATURES order, nulls set to 0
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    
+    parquet_file = pq.ParquetFile(path)
+    columns = {name.strip(): name for name in parquet_file.schema_arrow.names}
+    present = [feature for feature in REQUIRED_FEATURES if feature in columns]
+    
+    for batch in parquet_file.iter_batches(
+        batch_size=chunk_size, columns=[columns[feature] for feature in present]
+    ):
+        matrix = np.zeros((batch.num_rows, len(REQUIRED_FEATURES)))
+        for position, feature in enumerate(present):
+            column = pc.fill_null(batch.column(position).cast(pa.float64()), 0)
+            matrix[:, FEATURE_INDEX[feature]] = column.to_numpy(zero_copy_only=False)
+        yield matrix
+
+def init_bulk_worker(model_path, input_format, header):
+    """
+    Load the model once in a bulk scoring worker process
+    
+    Args:
+        model_path (str): Model to load, compiled forests are memory-mapped
+            and shared between workers
+        input_format (str): Format of the raw chunks
+        header (list): Stripped CSV column names
+    """
+    _worker_state["model"] = load_model(model_path)
+    _worker_state["format"] = input_format
+    _worker_state["header"] = header
+
+def score_chunk(chunk):
+    """
+    Score one chunk of a bulk input file in a worker process
+    
+    Args:
+        chunk: Raw lines, or a feature matrix for Parquet input
+        
+    Returns:
+        tuple: (output, rows) with the JSON result lines and their count
+    """
+    model = _worker_state["model"]
+    if isinstance(chunk, np.ndarray):
+        matrix, errors = chunk, check_finite(chunk, {})
+    else:
+        records = parse_lines(chunk, _worker_state["format"], _worker_state["header"])
+        matrix, errors = features_matrix(records)
+    
+    if model is None:
+        results = [error_result("Failed to load model")] * len(matrix)
+    else:
+        results = predict_matrix(model, matrix, errors)
+    return "".join(json.dumps(result) + "\n" for result in results), len(results)
+
+def score_bulk(path, outfile, input_format=None, model_path=None, workers=None,
+               chunk_size=BATCH_SIZE):
+    """
+    Score a large flow file on a pool of worker processes
+    
+    Chunks are fanned out to the workers and the results are written in
+    input order, one JSON result per line. Progress goes to stderr.
+    
+    Args:
+        path (str): CSV, JSON lines or Parquet file to score
+        outfile: Text stream the results are written to
+        input_format (str): "csv", "jsonl" or "parquet"
+        model_path (str): Model to load instead of the configured one
+        workers (int): Number of worker processes, defaults to the CPU count
+        chunk_size (int): Number of rows sent to a worker at a time
+    """
+    input_format = input_format or detect_format(path)
+    workers = workers or os.cpu_count() or 1
+    # Compile a joblib model once here, the workers then memory-map the copy
+    load_model(model_path)
+    header, chunks = open_bulk_input(path, input_format, chunk_size)
+    
+    rows = 0
+    started = last_report = time.monotonic()
+    
+    def write_next():
+        nonlocal rows, last_report
+        output, count = pending.popleft().get()
+        outfile.write(output)
+        rows += count
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            print(f"Scored {rows} rows ({rows / (now - started):.0f} rows/s)", file=sys.stderr)
+    
+    with multiprocessing.Pool(workers, init_bulk_worker, (model_path, input_format, header)) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(score_chunk, (chunk,)))
+            if len(pending) >= workers * PENDING_CHUNKS_PER_WORKER:
+                write_next()
+        while pending:
+            write_next()
+    
+    outfile.flush()
+    elapsed = time.monotonic() - started
+    print(f"Scored {rows} rows in {elapsed:.1f}s with {workers} workers", file=sys.stderr)
+
+def handle_request(model, line, buffer=None):
+    """
+    Score one newline-delimited JSON request received in server mode
+    
+    A request is either {"id": ..., "features": {...}} or a bare feature
+    object whose optional "id" key is used as the request id.
+    
+    Args:
+        model: The trained model
+        line (bytes): One line of JSON input
+        buffer (ndarray): Feature buffer reused by the fast path
+        
+    Returns:
+        dict: Prediction result tagged with the request id
+    """
+    request_id = None
+    try:
+        request = json.loads(line)
+        if isinstance(request, dict) and "features" in request:
+            request_id = request.get("id")
+            features = request["features"]
+        elif isinstance(request, dict):
+            features = dict(request)
+            request_id = features.pop("id", None)
+        else:
+            features = request
+        result = score_record(model, features, buffer)
     except Exception as e:
-        print(f"Error making prediction: {str(e)}", file=sys.stderr)
-        return {
-            "is_anomaly": False,
-            "probability": 0.0,
-            "error": str(e)
-        }
+        result = error_result(str(e))
+    
+    return {"id": request_id, **result}
+
+def serve_stream(model, infile, outfile):
+    """
+    Answer newline-delimited JSON requests until the input is exhausted
+    
+    Args:
+        model: The trained model
+        infile: Binary stream to read requests from
+        outfile: Binary stream to write one result per line to
+    """
+    buffer = np.zeros((1, len(REQUIRED_FEATURES)), dtype=np.float32)
+    for line in infile:
+        if not line.strip():
+            continue
+        response = handle_request(model, line, buffer)
+        outfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        outfile.flush()
+
+def socket_in_use(socket_path):
+    """
+    Check whether a server already accepts connections on a Unix socket
+    
+    Args:
+        socket_path (str): Filesystem path of the socket
+        
+    Returns:
+        bool: True if a server answered
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+            return True
+        except OSError:
+            return False
+
+def serve_socket(model, socket_path):
+    """
+    Answer newline-delimited JSON requests on a Unix domain socket
+    
+    Every connection is served on its own thread and shares the loaded model.
+    
+    Args:
+        model: The trained model
+        socket_path (str): Filesystem path of the socket to listen on
+    """
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve_stream(model, self.rfile, self.wfile)
+    
+    if os.path.exists(socket_path):
+        # Left behind by a server that did not exit cleanly
+        os.unlink(socket_path)
+    
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    server.daemon_threads = True
+    print(f"Prediction server listening on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+def serve(socket_path=None, model_path=None):
+    """
+    Run the long-lived prediction server, loading the model only once
+    
+    Args:
+        socket_path (str): Unix socket to listen on, stdin/stdout if None
+        model_path (str): Model to load instead of the configured one
+    """
+    if socket_path and socket_in_use(socket_path):
+        print(json.dumps(error_result(f"A prediction server is already listening on {socket_path}")), flush=True)
+        return
+    
+    model = load_model(model_path)
+    if model is None:
+        print(json.dumps(error_result("Failed to load model")), flush=True)
+        return
+    
+    if socket_path:
+        serve_socket(model, socket_path)
+    else:
+        serve_stream(model, sys.stdin.buffer, sys.stdout.buffer)
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments
+    
+    Args:
+        argv (list): Arguments to parse, defaults to sys.argv[1:]
+        
+    Returns:
+        argparse.Namespace: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Score network flow features with the IDS Random Forest model"
+    )
+    parser.add_argument(
+        "features",
+        nargs="?",
+        help="JSON encoded feature record to score"
+    )
+    parser.add_argument(
+        "--model",
+        metavar="PATH",
+        help=f"Joblib model or compiled forest directory to use, defaults to "
+        f"${MODEL_PATH_ENV} or the bundled model"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep the model loaded and score newline-delimited JSON records "
+        "read from stdin (or --socket), writing one result per line"
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Listen on this Unix socket instead of stdin in --serve mode"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Score every record of a JSON array, JSON lines or CSV file "
+        "(\"-\" for stdin), writing one result per line"
+    )
+    parser.add_argument(
+        "--bulk",
+        metavar="FILE",
+        help="Score a large CSV, JSON lines or Parquet flow file in chunks "
+        "on a pool of worker processes, writing results in input order"
+    )
+    parser.add_argument(
+        "--format",
+        choices=("json", "jsonl", "csv", "parquet"),
+        help="Input format for --batch/--bulk, guessed from the extension by default"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Number of records scored per model call in --batch/--bulk mode"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes for --bulk, defaults to the CPU count"
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="Write --batch/--bulk results to this file instead of stdout"
+    )
+    parser.add_argument(
+        "--no-fast-path",
+        action="store_true",
+        help="Preprocess single records through a pandas DataFrame"
+    )
+    return parser.parse_args(argv)
 
 def main():
     """
     Main function to handle prediction from command line
     """
+    global FAST_PATH
     try:
+        args = parse_args()
+        if args.no_fast_path:
+            FAST_PATH = False
+        
+        if args.serve:
+            serve(args.socket, args.model)
+            return
+        
+        if args.batch or args.bulk:
+            outfile = open(args.output, "w") if args.output else sys.stdout
+            try:
+                if args.bulk:
+                    score_bulk(args.bulk, outfile, args.format, args.model,
+                               args.workers, args.batch_size)
+                    return
+                
+                model = load_model(args.model)
+                if model is None:
+                    print(json.dumps(error_result("Failed to load model")))
+                    return
+                score_file(model, args.batch, outfile, args.format, args.batch_size)
+            finally:
+                if outfile is not sys.stdout:
+                    outfile.close()
+            return
+        
         # Check if features are provided as command line argument
-        if len(sys.argv) < 2:
-            print(json.dumps({
-                "is_anomaly": False,
-                "probability": 0.0,
-                "error": "No features provided"
-            }))
+        if args.features is None:
+            print(json.dumps(error_result("No features provided")))
             return
         
         # Parse features from command line argument
-        features_json = sys.argv[1]
-        features = json.loads(features_json)
+        features = json.loads(args.features)
         
         # Load model
-        model = load_model()
+        model = load_model(args.model)
         if model is None:
-            print(json.dumps({
-                "is_anomaly": False,
-                "probability": 0.0,
-                "error": "Failed to load model"
-            }))
-            return
-        
-        # Preprocess features
-        processed_features = preprocess_features(features)
-        if processed_features is None:
-            print(json.dumps({
-                "is_anomaly": False,
-                "probability": 0.0,
-                "error": "Failed to preprocess features"
-            }))
+            print(json.dumps(error_result("Failed to load model")))
             return
         
-        # Make prediction
-        result = predict(model, processed_features)
+        # Preprocess features and make prediction
+        result = score_record(model, features)
         
         # Output result as JSON
         print(json.dumps(result))
     except Exception as e:
-        print(json.dumps({
-            "is_anomaly": False,
-            "probability": 0.0,
-            "error": str(e)
-        }))
+        print(json.dumps(error_result(str(e))))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+""" Throughput benchmarks of the siem.py event formatting steps.
+Events come from a recorded JSONL fixture (--fixture) or, when there is none,
+from a synthetic generator shaped like the Central SIEM API events.
+
+    python3 bench_siem.py                      # 100k synthetic events
+    python3 bench_siem.py --fixture events.jsonl
+    python3 bench_siem.py --write-fixture events.jsonl
+"""
+
+import copy
+import json
+import random
+import re
+import sys
+import time
+from optparse import OptionParser
+
+import siem
+
+DEFAULT_COUNT = 100000
+DEFAULT_REPEAT = 3
+SEVERITIES = ("low", "medium", "high", "none")
+EVENT_TYPES = (
+    "Event::Endpoint::Threat::Detected",
+    "Event::Endpoint::WebControlViolation",
+    "Event::Endpoint::UpdateSuccess",
+    "Event::Endpoint::Application::Allowed",
+)
+
+
+def generate_events(count, seed=1):
+    """ Synthetic events standing in for a recorded fixture
+    Arguments:
+        count {int}: number of events
+        seed {int}: random seed, the same seed gives the same events
+    Returns:
+        events {list}: event dicts
+    """
+    rnd = random.Random(seed)
+    events = []
+    for i in range(count):
+        event = {
+            "id": "ev-%d" % i,
+            "type": rnd.choice(EVENT_TYPES),
+            "name": "Threat 'Troj/Agent-%d' found in C:\\temp\\a=%d.exe" % (i % 97, i),
+            "severity": rnd.choice(SEVERITIES),
+            "source": "DOMAIN\\user%d" % (i % 211),
+            "when": "2021-01-01T%02d:%02d:%02d.000Z" % (i // 3600 % 24, i // 60 % 60, i % 60),
+            "created_at": "2021-01-01T%02d:%02d:%02d.000Z" % (i // 3600 % 24, i // 60 % 60, i % 60),
+            "location": rnd.choice(("host-%d.example.com" % (i % 500), "Laptop %d" % (i % 300), "WS-%d." % (i % 40))),
+            "user_id": None if i % 3 == 0 else "u-%d" % (i % 1000),
+            "customer_id": "c-1",
+            "endpoint_id": "e-%d" % (i % 500),
+            "endpoint_type": "computer",
+            "group": None,
+            "threat": "Troj/Agent-%d" % (i % 97),
+            "origin": rnd.choice(("ML", "AV", None)),
+        }
+        if i % 4 == 0:
+            event["core_remedy_items"] = {"totalItems": 1, "items": [{"type": "file", "result": "SUCCESS"}]}
+        if i % 10 == 0:
+            event["source_info"] = {"ip": "10.0.%d.%d" % (i // 256 % 256, i % 256)}
+        events.append(event)
+    return events
+
+
+def read_fixture(path):
+    """ Events of a recorded JSONL fixture, one event per line
+    Arguments:
+        path {str}: fixture path
+    Returns:
+        events {list}: event dicts
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_fixture(path, events):
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def measure(fn, events, repeat):
+    """ Best time of fn over all events, each run on a fresh copy
+    Arguments:
+        fn {function}: per event function, may modify its argument
+        events {list}: event dicts
+        repeat {int}: runs
+    Returns:
+        float -- events per second of the fastest run
+    """
+    best = None
+    for _ in range(repeat):
+        batch = copy.deepcopy(events)
+        start = time.perf_counter()
+        for event in batch:
+            fn(event)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(events) / best
+
+
+def report(name, before, after):
+    print("%-28s %10.0f -> %10.0f events/s  (x%.2f)" % (name, before, after, after / before))
+
+
+def legacy_update_cef_keys(data):
+    """ CEF key renaming as update_cef_keys() did it before MappingPlan """
+    for key, value in list(data.items()):
+        new_key = siem.CEF_MAPPING.get(key, key)
+        if new_key == key:
+            continue
+        if new_key == "dhost" and not siem.is_valid_fqdn(value):
+            value = siem.convert_to_valid_fqdn(value)
+        data[new_key] = value
+        del data[key]
+
+
+def legacy_mapping(event):
+    """ remove_null_values() followed by update_cef_keys(), the path MappingPlan replaces """
+    event = siem.remove_null_values(event)
+    legacy_update_cef_keys(event)
+    return event
+
+
+def bench_mapping(events, repeat):
+    """ Null removal and CEF key renaming alone """
+    for event in events[:1000]:
+        if legacy_mapping(copy.deepcopy(event)) != siem.MAPPING_PLAN.apply(event):
+            raise Exception("MappingPlan output differs for event %s" % event.get("id"))
+    report(
+        "mapping",
+        measure(legacy_mapping, events, repeat),
+        measure(siem.MAPPING_PLAN.apply, events, repeat),
+    )
+
+
+def legacy_json(event):
+    """ JSON line as write_json_format() built it before the JSON_ENCODER/bytes path """
+    event = legacy_mapping(event)
+    siem.name_mapping.update_fields(siem.log, event)
+    return json.dumps(event, ensure_ascii=False).strip().encode("utf-8")
+
+
+def legacy_keyvalue(event):
+    """ Key value line as write_keyvalue_format() built it before the bytes path """
+    event = legacy_mapping(event)
+    siem.name_mapping.update_fields(siem.log, event)
+    events = list('%s="%s";' % (k, v) for k, v in event.items())
+    return " ".join([event[u"rt"]] + events).strip().encode("utf-8")
+
+
+def current_line(fmt):
+    """ Encoded line of an event as fetch_pages() hands it to a byte sink """
+    formatter = siem.FORMATTERS[fmt]
+    return lambda event: formatter(event).encode("utf-8")
+
+
+def bench_formats(events, repeat):
+    """ Raw event to encoded output line, json and keyvalue """
+    for fmt, legacy in (("json", legacy_json), ("keyvalue", legacy_keyvalue)):
+        current = current_line(fmt)
+        for event in events[:1000]:
+            if legacy(copy.deepcopy(event)) != current(copy.deepcopy(event)):
+                raise Exception("%s output differs for event %s" % (fmt, event.get("id")))
+        report(fmt, measure(legacy, events, repeat), measure(current, events, repeat))
+
+
+# CEF encoding as it was before CefEncoder, kept here as the baseline
+# CEF format from https://www.protect724.hpe.com/docs/DOC-1072
+LEGACY_CEF_FORMAT = (
+    "CEF:%(version)s|%(device_vendor)s|%(device_product)s|"
+    "%(device_version)s|%(device_event_class_id)s|%(name)s|%(severity)s|"
+)
+
+
+def legacy_flatten_json(y):
+    out = {}
+
+    def flatten(x, name=""):
+        if type(x) is dict:
+            for a in x:
+                flatten(x[a], name + a + "_")
+        else:
+            out[name[:-1]] = x
+
+    flatten(y)
+    return out
+
+
+def legacy_format_prefix(data):
+    return re.compile(r"([|\\])").sub(r"\\\1", data)
+
+
+def legacy_format_extension(data):
+    if type(data) is str:
+        return re.compile(r"([=\\])").sub(r"\\\1", data)
+    return data
+
+
+def legacy_format_cef(data):
+    fields = {
+        "version": siem.CEF_CONFIG["cef.version"],
+        "device_vendor": siem.CEF_CONFIG["cef.device_vendor"],
+        "device_version": siem.CEF_CONFIG["cef.device_version"],
+        "device_product": siem.CEF_CONFIG["cef.device_product"],
+    }
+    for field in ("name", "device_event_class_id"):
+        fields[field] = legacy_format_prefix(data.pop(siem.CEF_MAPPING[field], siem.MISSING_VALUE))
+    fields["severity"] = siem.map_severity(data.pop(siem.CEF_MAPPING["severity"], siem.MISSING_VALUE))
+    msg = LEGACY_CEF_FORMAT % fields
+
+    for key, value in list(data.items()):
+        new_key = siem.CEF_MAPPING.get(key, key)
+        if new_key == key:
+            continue
+        if new_key == "dhost" and not siem.is_valid_fqdn(value):
+            value = siem.convert_to_valid_fqdn(value)
+        data[new_key] = value
+        del data[key]
+    for index, (key, value) in enumerate(data.items()):
+        value = legacy_format_extension(value)
+        if index > 0:
+            msg += " %s=%s" % (key, value)
+        else:
+            msg += "%s=%s" % (key, value)
+    return msg
+
+
+def legacy_cef(event):
+    """ CEF line as write_cef_format() built it before CefEncoder """
+    event = siem.remove_null_values(event)
+    siem.name_mapping.update_fields(siem.log, event)
+    return legacy_format_cef(legacy_flatten_json(event)).strip().encode("utf-8")
+
+
+def bench_cef(events, repeat):
+    """ Raw event to encoded CEF line, before and after CefEncoder """
+    current = current_line("cef")
+    for event in events[:1000]:
+        if legacy_cef(copy.deepcopy(event)) != current(copy.deepcopy(event)):
+            raise Exception("cef output differs for event %s" % event.get("id"))
+    report("cef", measure(legacy_cef, events, repeat), measure(current, events, repeat))
+
+
+BENCHMARKS = {
+    "mapping": bench_mapping,
+    "formats": bench_formats,
+    "cef": bench_cef,
+}
+
+
+def parse_args():
+    parser = OptionParser(description="Benchmark the siem.py event formatting steps")
+    parser.add_option("--fixture", help="Recorded JSONL events, one per line (default: synthetic events)")
+    parser.add_option("--count", type="int", default=DEFAULT_COUNT,
+                      help="Synthetic events to generate (default: %d)" % DEFAULT_COUNT)
+    parser.add_option("--repeat", type="int", default=DEFAULT_REPEAT,
+                      help="Runs per measurement, the fastest is reported (default: %d)" % DEFAULT_REPEAT)
+    parser.add_option("--only", default=",".join(BENCHMARKS),
+                      help="Comma separated benchmarks to run: %s" % ", ".join(BENCHMARKS))
+    parser.add_option("--write-fixture", metavar="PATH", help="Write the synthetic events as a JSONL fixture and exit")
+    options, _ = parser.parse_args()
+    return options
+
+
+def main():
+    options = parse_args()
+    siem.QUIET = True
+    events = read_fixture(options.fixture) if options.fixture else generate_events(options.count)
+    if options.write_fixture:
+        write_fixture(options.write_fixture, events)
+        return
+    names = options.only.split(",")
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit("Unknown benchmark %s, choose from %s" % (name, ", ".join(BENCHMARKS)))
+    print("%d events, best of %d runs" % (len(events), options.repeat))
+    for name in names:
+        BENCHMARKS[name](events, options.repeat)
+
+
+if __name__ == "__main__":
+    main()
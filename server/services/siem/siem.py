@@ -12,14 +12,23 @@
 # License.
 #
 import sys
+import copy
+import functools
+import itertools
 import json
 import logging
 import logging.handlers
 import os
+import queue
 import re
+import signal
+import threading
+import time
 import state
+from concurrent.futures import ThreadPoolExecutor
 from optparse import OptionParser
 import name_mapping
+import sinks
 import config
 import api_client
 import vercheck
@@ -28,6 +37,33 @@ VERSION = "2.0.1"
 QUIET = False
 MISSING_VALUE = "NA"
 DEFAULT_ENDPOINT = "event"
+# Events formatted and flushed together, the page size the API returns
+PAGE_SIZE = 1000
+# Marks the end of a stream on the concurrent fetch queue
+STREAM_DONE = object()
+
+# Minimum seconds between fsyncs of the checkpoint file, it is replaced after every page
+CHECKPOINT_INTERVAL = 1.0
+# Event ids remembered per endpoint to skip events replayed after a restart
+DEDUP_WINDOW = 2 * PAGE_SIZE
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+# Bounds of the adaptive polling interval in --daemon mode, in seconds
+POLL_MIN_INTERVAL = 10.0
+POLL_MAX_INTERVAL = 300.0
+# Set by SIGTERM/SIGINT in --daemon mode, fetching stops after the current page
+STOP = threading.Event()
+# ApiClient per tenant and endpoint, kept for the life of the process
+API_CLIENTS = {}
+
+# Distinct locations whose normalized dhost is remembered
+DHOST_CACHE_SIZE = 8192
+
+# Whole-name equivalent of checking every label against
+# ^[a-zA-Z0-9]+(-[a-zA-Z0-9]+)*$ with re.match, which lets a label end in a newline
+FQDN_LABEL = r"(?![^.]{64})[a-zA-Z0-9]+(?:-[a-zA-Z0-9]+)*\n?"
+FQDN_PATTERN = re.compile(r"(?!.{256})%s(?:\.%s)*" % (FQDN_LABEL, FQDN_LABEL), re.DOTALL)
+INVALID_LABEL_CHARS = re.compile("[^-a-z0-9]+")
 
 SEVERITY_MAP = {"none": 0, "low": 1, "medium": 5, "high": 8, "very_high": 10}
 
@@ -38,13 +74,6 @@ CEF_CONFIG = {
     "cef.device_version": 1.0,
 }
 
-# CEF format from https://www.protect724.hpe.com/docs/DOC-1072
-CEF_FORMAT = (
-    "CEF:%(version)s|%(device_vendor)s|%(device_product)s|"
-    "%(device_version)s|%(device_event_class_id)s|%(name)s|%(severity)s|"
-)
-
-
 CEF_MAPPING = {
     # This is used for mapping CEF header prefix and extension to json returned by server
     # CEF header prefix to json mapping
@@ -64,64 +93,219 @@ CEF_MAPPING = {
     "location": "dhost",
 }
 
+# Reused for every event, json.dumps() builds a new encoder per call when given options
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
 # Initialize the SIEM_LOGGER
 SIEM_LOGGER = logging.getLogger("SIEM")
 SIEM_LOGGER.setLevel(logging.INFO)
 SIEM_LOGGER.propagate = False
 logging.basicConfig(format="%(message)s")
 
+# Where formatted events go, replaced in main() when --sink is given
+OUTPUT_SINK = sinks.LoggingSink(SIEM_LOGGER)
+
 
 def is_valid_fqdn(fqdn):
     fqdn = fqdn.strip()
     fqdn = fqdn[:-1] if fqdn.endswith(".") else fqdn  # chomp trailing period
-    return fqdn and len(fqdn) < 256 and all(part and len(part) < 64 and re.match(r"^[a-zA-Z0-9]+(-[a-zA-Z0-9]+)*$", part) for part in fqdn.split("."))
+    return FQDN_PATTERN.fullmatch(fqdn) is not None
 
 def convert_to_valid_fqdn(value):
-    return ".".join([re.sub("[^-a-z0-9]+", "-", x.strip()).strip("-") for x in value.lower().split(".") if x.strip()])
+    return ".".join([INVALID_LABEL_CHARS.sub("-", x.strip()).strip("-") for x in value.lower().split(".") if x.strip()])
 
-def write_json_format(results):
-    """Write JSON format data.
+@functools.lru_cache(maxsize=DHOST_CACHE_SIZE)
+def normalize_dhost(value):
+    return value if is_valid_fqdn(value) else convert_to_valid_fqdn(value)
+
+def format_json_event(event):
+    """Format one event as JSON.
     Arguments:
-        results {list}: data
+        event {dict}: event data
+    Returns:
+        string -- formatted event
     """
-    for i in results:
-        i = remove_null_values(i)
-        update_cef_keys(i)
-        name_mapping.update_fields(log, i)
-        SIEM_LOGGER.info(json.dumps(i, ensure_ascii=False).strip())
+    event = MAPPING_PLAN.apply(event)
+    name_mapping.update_fields(log, event)
+    return JSON_ENCODER.encode(event)
 
 
-def write_keyvalue_format(results):
-    """Write key value format data.
+def format_keyvalue_event(event):
+    """Format one event as key value pairs.
     Arguments:
-        results {dict}: results
+        event {dict}: event data
+    Returns:
+        string -- formatted event
     """
-    for i in results:
-        i = remove_null_values(i)
-        update_cef_keys(i)
-        name_mapping.update_fields(log, i)
-        date = i[u"rt"]
-        # TODO:  Spaces/quotes/semicolons are not escaped here, does it matter?
-        events = list('%s="%s";' % (k, v) for k, v in i.items())
-        SIEM_LOGGER.info(
-            " ".join(
-                [
-                    date,
-                ]
-                + events
-            ).strip()
-        )
+    event = MAPPING_PLAN.apply(event)
+    name_mapping.update_fields(log, event)
+    date = event[u"rt"]
+    # TODO:  Spaces/quotes/semicolons are not escaped here, does it matter?
+    return (date + " " + " ".join([f'{k}="{v}";' for k, v in event.items()])).strip()
+
+
+def format_cef_event(event):
+    """Format one event as CEF.
+    Arguments:
+        event {dict}: event data
+    Returns:
+        string -- formatted event
+    """
+    event = remove_null_values(event)
+    name_mapping.update_fields(log, event)
+    return format_cef(flatten_json(event)).strip()
+
+
+FORMATTERS = {
+    "json": format_json_event,
+    "keyvalue": format_keyvalue_event,
+    "cef": format_cef_event,
+}
 
 
-def write_cef_format(results):
-    """Write CEF format data.
+def iter_pages(results, page_size=PAGE_SIZE):
+    """Group events into pages as they arrive, without materializing them.
     Arguments:
-        results {list}: data
+        results {iterable}: events
+        page_size {int}: events per page
+    Returns:
+        generator -- lists of at most page_size events
+    """
+    results = iter(results)
+    while True:
+        page = list(itertools.islice(results, page_size))
+        if not page:
+            return
+        yield page
+
+
+def flush_output():
+    """Flush the output sink so a page is delivered before it is checkpointed."""
+    OUTPUT_SINK.flush()
+
+
+class Checkpoint:
+    """ Per page resume point of every endpoint of a tenant.
+    For each endpoint the newest created_at written and the ids of the last
+    window events are kept. An event with a remembered id was already
+    written and is skipped. Events arrive in created_at order, so while a
+    restart replays events up to the saved created_at, the older ones are
+    skipped too; once the replay reaches that mark a late event is kept.
+    The file is replaced atomically after every page, so a restart of the
+    process emits nothing twice. It is fsynced at most every interval seconds
+    and on close(), after an OS crash only the pages written since the last
+    fsync are emitted again. Only the output is deduplicated: the ApiClient
+    resumes from its own cursor and may download those events again.
     """
-    for i in results:
-        i = remove_null_values(i)
-        name_mapping.update_fields(log, i)
-        SIEM_LOGGER.info(format_cef(flatten_json(i)).strip())
+
+    def __init__(self, path, interval=CHECKPOINT_INTERVAL, window=DEDUP_WINDOW, resume=True):
+        self.path = path
+        self.interval = interval
+        self.window = window
+        self.endpoints = {}
+        self.dirty = False
+        self.last_sync = time.monotonic()
+        if resume:
+            self.load()
+
+    def load(self):
+        """ Read the checkpoint file, a missing or unreadable file starts afresh """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            log("Ignoring unreadable checkpoint %s: %s" % (self.path, e))
+            return
+        for endpoint, cursor in data.items():
+            self.endpoints[endpoint] = {
+                "created_at": cursor.get("created_at"),
+                "ids": dict.fromkeys(cursor.get("ids", [])[-self.window:]),
+                # Cleared by filter() once the replay reaches the saved mark
+                "replay_until": cursor.get("created_at"),
+            }
+
+    def filter(self, endpoint, lines, page):
+        """ Drop the events of a page that were already written
+        Arguments:
+            endpoint {str}: endpoint name
+            lines {list}: formatted events
+            page {list}: events the lines were formatted from
+        Returns:
+            tuple -- (lines, page) of the events not written yet
+        """
+        cursor = self.endpoints.get(endpoint)
+        if cursor is None:
+            return lines, page
+        ids = cursor["ids"]
+        keep = []
+        for i, event in enumerate(page):
+            event_id = event.get("id")
+            created_at = event.get("created_at")
+            if cursor.get("replay_until") and created_at:
+                if created_at < cursor["replay_until"]:
+                    continue
+                cursor["replay_until"] = None
+            if event_id is None or event_id not in ids:
+                keep.append(i)
+        if len(keep) == len(page):
+            return lines, page
+        return [lines[i] for i in keep], [page[i] for i in keep]
+
+    def advance(self, endpoint, page):
+        """ Record a page that was just written and flushed
+        Arguments:
+            endpoint {str}: endpoint name
+            page {list}: events that were written
+        """
+        cursor = self.endpoints.setdefault(endpoint, {"created_at": None, "ids": {}})
+        ids = cursor["ids"]
+        for event in page:
+            if event.get("id") is not None:
+                ids[event["id"]] = None
+            created_at = event.get("created_at")
+            if created_at and (not cursor["created_at"] or created_at > cursor["created_at"]):
+                cursor["created_at"] = created_at
+        for _ in range(len(ids) - self.window):
+            del ids[next(iter(ids))]
+        self.dirty = True
+        self.save(sync=time.monotonic() - self.last_sync >= self.interval)
+
+    def save(self, sync=True):
+        """ Replace the checkpoint file with the current cursors, atomically
+        Arguments:
+            sync {bool}: fsync the file and the rename, so they survive an OS crash
+        """
+        data = {
+            endpoint: {"created_at": cursor["created_at"], "ids": list(cursor["ids"])}
+            for endpoint, cursor in self.endpoints.items()
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if sync and os.name == "posix":
+            # Make the rename itself durable
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.dirty = not sync
+        if sync:
+            self.last_sync = time.monotonic()
+
+    def flush(self):
+        """ Save and fsync cursors not fsynced yet """
+        if self.dirty:
+            self.save()
+
+    def close(self):
+        self.flush()
 
 
 # Flattening JSON objects in Python
@@ -129,14 +313,14 @@ def write_cef_format(results):
 def flatten_json(y):
     out = {}
 
-    def flatten(x, name=""):
-        if type(x) is dict:
-            for a in x:
-                flatten(x[a], name + a + "_")
-        else:
-            out[name[:-1]] = x
+    def flatten(x, prefix):
+        for key, value in x.items():
+            if type(value) is dict:
+                flatten(value, prefix + key + "_")
+            else:
+                out[prefix + key] = value
 
-    flatten(y)
+    flatten(y, "")
     return out
 
 
@@ -149,31 +333,6 @@ def log(s):
         sys.stderr.write("%s\n" % s)
 
 
-def format_prefix(data):
-    """ pipe and backslash in header must be escaped. escape group with backslash
-    Arguments:
-        data {string}: data
-    Returns:
-        string -- backslash escape string
-    """
-    # pipe and backslash in header must be escaped
-    # escape group with backslash
-    return re.compile(r"([|\\])").sub(r"\\\1", data)
-
-
-def format_extension(data):
-    """ equal sign and backslash in extension value must be escaped. escape group with backslash.
-    Arguments:
-        data : data
-    Returns:
-        string/list -- backslash escape string or return same value
-    """
-    if type(data) is str:
-        return re.compile(r"([=\\])").sub(r"\\\1", data)
-    else:
-        return data
-
-
 def map_severity(severity):
     if severity in SEVERITY_MAP:
         return SEVERITY_MAP[severity]
@@ -183,55 +342,97 @@ def map_severity(severity):
         return SEVERITY_MAP["none"]
 
 
-def extract_prefix_fields(data):
-    """ extract prefix fields and remove those from data dictionary
-    Arguments:
-        data {dict}: data
-    Returns:
-        fields {dict} -- fields object
+class MappingPlan:
+    """ CEF key renaming compiled once from a CEF mapping.
+    apply() drops null values and renames keys to their CEF names in a
+    single pass over the event: a renamed key takes the place of an existing
+    key of the same name, otherwise it is appended in event order.
     """
-    name_field = CEF_MAPPING["name"]
-    device_event_class_id_field = CEF_MAPPING["device_event_class_id"]
-    severity_field = CEF_MAPPING["severity"]
-
-    name = data.get(name_field, MISSING_VALUE)
-    name = format_prefix(name)
-    data.pop(name_field, None)
-
-    device_event_class_id = data.get(device_event_class_id_field, MISSING_VALUE)
-    device_event_class_id = format_prefix(device_event_class_id)
-    data.pop(device_event_class_id_field, None)
-
-    severity = data.get(severity_field, MISSING_VALUE)
-    severity = map_severity(severity)
-    data.pop(severity_field, None)
-
-    fields = {
-        "name": name,
-        "device_event_class_id": device_event_class_id,
-        "severity": severity,
-        "version": CEF_CONFIG["cef.version"],
-        "device_vendor": CEF_CONFIG["cef.device_vendor"],
-        "device_version": CEF_CONFIG["cef.device_version"],
-        "device_product": CEF_CONFIG["cef.device_product"],
-    }
-    return fields
-
-
-def update_cef_keys(data):
-    """ Replace if there is a mapped CEF key
-    Arguments:
-        data {dict}: data
+
+    def __init__(self, cef_mapping=CEF_MAPPING):
+        self.renames = {key: new_key for key, new_key in cef_mapping.items() if key != new_key}
+        chained = set(self.renames).intersection(self.renames.values())
+        if chained:
+            raise ValueError("CEF mapping renames keys to other renamed keys: %s" % ", ".join(sorted(chained)))
+        self.converters = {"dhost": normalize_dhost}
+
+    def apply(self, data, drop_null=True):
+        """ Record with null values dropped and CEF keys renamed
+        Arguments:
+            data {dict}: event data, left untouched
+            drop_null {bool}: drop keys whose value is None
+        Returns:
+            record {dict}: mapped data
+        """
+        record = {}
+        renamed = []
+        renames = self.renames
+        for key, value in data.items():
+            if value is None and drop_null:
+                continue
+            new_key = renames.get(key)
+            if new_key is None:
+                record[key] = value
+            else:
+                renamed.append((new_key, value))
+        for new_key, value in renamed:
+            converter = self.converters.get(new_key)
+            record[new_key] = converter(value) if converter else value
+        return record
+
+
+MAPPING_PLAN = MappingPlan()
+
+
+class CefEncoder:
+    """ Encode flattened events as CEF messages.
+    The escape tables and the constant part of the header are built once, each
+    message is assembled with a single join.
     """
-    # Replace if there is a mapped CEF key
-    for key, value in list(data.items()):
-        new_key = CEF_MAPPING.get(key, key)
-        if new_key == key:
-            continue
-        if new_key == "dhost" and not is_valid_fqdn(value):
-            value = convert_to_valid_fqdn(value)
-        data[new_key] = value
-        del data[key]
+
+    # pipe and backslash in header must be escaped
+    PREFIX_ESCAPES = str.maketrans({"|": "\\|", "\\": "\\\\"})
+    # equal sign and backslash in extension value must be escaped
+    EXTENSION_ESCAPES = str.maketrans({"=": "\\=", "\\": "\\\\"})
+
+    def __init__(self, cef_config=CEF_CONFIG, cef_mapping=CEF_MAPPING):
+        self.header = "CEF:%s|%s|%s|%s|" % (
+            cef_config["cef.version"],
+            cef_config["cef.device_vendor"],
+            cef_config["cef.device_product"],
+            cef_config["cef.device_version"],
+        )
+        self.name_field = cef_mapping["name"]
+        self.device_event_class_id_field = cef_mapping["device_event_class_id"]
+        self.severity_field = cef_mapping["severity"]
+        self.plan = MappingPlan(cef_mapping)
+
+    def encode(self, data):
+        """ Message CEF formatted, prefix fields are removed from data
+        Arguments:
+            data {dict}: flattened data
+        Returns:
+            data {str}: message
+        """
+        name = data.pop(self.name_field, MISSING_VALUE).translate(self.PREFIX_ESCAPES)
+        device_event_class_id = data.pop(
+            self.device_event_class_id_field, MISSING_VALUE
+        ).translate(self.PREFIX_ESCAPES)
+        severity = map_severity(data.pop(self.severity_field, MISSING_VALUE))
+
+        # Nested null values were flattened into the data and are kept
+        data = self.plan.apply(data, drop_null=False)
+        escapes = self.EXTENSION_ESCAPES
+        extension = " ".join(
+            "%s=%s" % (key, value.translate(escapes) if type(value) is str else value)
+            for key, value in data.items()
+        )
+        return "".join(
+            (self.header, device_event_class_id, "|", name, "|", str(severity), "|", extension)
+        )
+
+
+CEF_ENCODER = CefEncoder()
 
 
 def format_cef(data):
@@ -241,17 +442,7 @@ def format_cef(data):
     Returns:
         data {str}: message
     """
-    fields = extract_prefix_fields(data)
-    msg = CEF_FORMAT % fields
-
-    update_cef_keys(data)
-    for index, (key, value) in enumerate(data.items()):
-        value = format_extension(value)
-        if index > 0:
-            msg += " %s=%s" % (key, value)
-        else:
-            msg += "%s=%s" % (key, value)
-    return msg
+    return CEF_ENCODER.encode(data)
 
 
 def remove_null_values(data):
@@ -326,6 +517,76 @@ def parse_args_options():
         action="store_true",
         help="Suppress status messages",
     )
+    parser.add_option(
+        "--concurrency",
+        default=1,
+        type="int",
+        help="Number of endpoint/tenant streams fetched at the same time, "
+        "defaults to 1 (one after another)",
+    )
+    parser.add_option(
+        "--pages-in-flight",
+        default=4,
+        type="int",
+        help="Maximum number of fetched pages waiting to be written "
+        "when fetching concurrently, defaults to 4",
+    )
+    parser.add_option(
+        "--rate-limit",
+        default=0,
+        type="float",
+        help="Maximum pages requested per second for each tenant, "
+        "defaults to 0 (unlimited)",
+    )
+    parser.add_option(
+        "--daemon",
+        default=False,
+        action="store_true",
+        help="Keep running and poll the endpoints until SIGTERM or SIGINT "
+        "instead of exiting after one pass",
+    )
+    parser.add_option(
+        "--poll-min",
+        default=POLL_MIN_INTERVAL,
+        type="float",
+        help="Shortest seconds between polls of an endpoint in daemon mode, "
+        "used while pages come back full, defaults to %s" % POLL_MIN_INTERVAL,
+    )
+    parser.add_option(
+        "--poll-max",
+        default=POLL_MAX_INTERVAL,
+        type="float",
+        help="Longest seconds between polls of an endpoint in daemon mode, "
+        "reached while polls come back empty, defaults to %s" % POLL_MAX_INTERVAL,
+    )
+    parser.add_option(
+        "--checkpoint-interval",
+        default=CHECKPOINT_INTERVAL,
+        type="float",
+        help="Minimum seconds between checkpoint fsyncs, the checkpoint is "
+        "replaced after every page and 0 also fsyncs it every page, defaults to %s" % CHECKPOINT_INTERVAL,
+    )
+    parser.add_option(
+        "--sink",
+        default="logging",
+        action="store",
+        help="Where to write events: logging, stdout, file:PATH, rotating:PATH, "
+        "udp://HOST:PORT or tcp://HOST:PORT, defaults to logging",
+    )
+    parser.add_option(
+        "--flush-size",
+        default=sinks.DEFAULT_FLUSH_SIZE,
+        type="int",
+        help="Number of events a sink writes at once, defaults to %d"
+        % sinks.DEFAULT_FLUSH_SIZE,
+    )
+    parser.add_option(
+        "--flush-interval",
+        default=sinks.DEFAULT_FLUSH_INTERVAL,
+        type="float",
+        help="Maximum seconds a sink holds events before writing them, "
+        "defaults to %s" % sinks.DEFAULT_FLUSH_INTERVAL,
+    )
 
     options, args = parser.parse_args()
 
@@ -364,50 +625,357 @@ def validate_endpoint(endpoint):
     if endpoint not in endpoint_map:
         raise Exception("Invalid endpoint in config.ini, endpoint can be event, alert or all")
 
-def get_alerts_or_events(endpoint, options, config, state):
+def split_tenants(config_data):
+    """ One config per tenant when tenant_id in config.ini lists several, comma separated.
+    Each tenant gets its own state file next to the configured one.
+    Arguments:
+        config_data {dict}: config file details
+    Returns:
+        configs {list}: config file details per tenant
+    """
+    tenant_ids = [
+        tenant_id.strip()
+        for tenant_id in str(getattr(config_data, "tenant_id", "") or "").split(",")
+        if tenant_id.strip()
+    ]
+    if len(tenant_ids) <= 1:
+        return [config_data]
+
+    configs = []
+    root, ext = os.path.splitext(config_data.state_file_path)
+    for tenant_id in tenant_ids:
+        tenant_config = copy.copy(config_data)
+        tenant_config.tenant_id = tenant_id
+        tenant_config.state_file_path = "%s_%s%s" % (root, tenant_id, ext)
+        configs.append(tenant_config)
+    return configs
+
+
+class RateLimiter:
+    """ Space out page requests to at most rate per second, a rate of 0 disables it. """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class LockedState:
+    """ Serialize save_state calls on a state shared by concurrent fetchers. """
+
+    def __init__(self, state_obj):
+        self._state = state_obj
+        self._lock = threading.Lock()
+
+    def save_state(self, *args, **kwargs):
+        with self._lock:
+            return self._state.save_state(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._state, name)
+
+
+def get_alerts_or_events(endpoint, options, config, state, checkpoint, rate_limiter=None):
     """ Get alerts/events data
     Arguments:
         endpoint {str}: endpoint name
         options {dict}: options
         config {dict}: config file details
         state {dict}: state file details
+        checkpoint {Checkpoint}: resume point of the tenant
+        rate_limiter {RateLimiter}: paces the page requests of a tenant
+    Returns:
+        count {int}: events fetched
     """
-    api_client_obj = api_client.ApiClient(endpoint, options, config, state)
-    results = api_client_obj.get_alerts_or_events()
-
-    if config.format == "json":
-        write_json_format(results)
-    elif config.format == "keyvalue":
-        write_keyvalue_format(results)
-    elif config.format == "cef":
-        write_cef_format(results)
-    else:
-        write_json_format(results)
+    count = 0
+    for lines, page in fetch_pages(endpoint, options, config, state, rate_limiter):
+        count += len(page)
+        write_page(endpoint, checkpoint, lines, page)
+    return count
+
+def fetch_pages(endpoint, options, config, state, rate_limiter=None):
+    """ Fetch alerts/events page by page and format them
+    Arguments:
+        endpoint {str}: endpoint name
+        options {dict}: options
+        config {dict}: config file details
+        state {dict}: state file details
+        rate_limiter {RateLimiter}: paces the page requests of a tenant
+    Returns:
+        generator -- (lines, events) per page, encoded when the sink takes bytes
+    """
+    results = get_api_client(endpoint, options, config, state).get_alerts_or_events()
+    formatter = FORMATTERS.get(config.format, format_json_event)
+
+    pages = iter_pages(results)
+    while not STOP.is_set():
+        if rate_limiter:
+            rate_limiter.wait()
+        page = next(pages, None)
+        if page is None:
+            return
+        if OUTPUT_SINK.encoded:
+            yield [formatter(event).encode("utf-8") for event in page], page
+        else:
+            yield [formatter(event) for event in page], page
 
-def run(options, config_data, state):
-    """ Call the fetch alerts/events method
+def get_api_client(endpoint, options, config, state):
+    """ ApiClient of a tenant endpoint, created on first use and then reused
+    so its session and token outlive a single poll
     Arguments:
+        endpoint {str}: endpoint name
         options {dict}: options
-        config_data {dict}: config file details
+        config {dict}: config file details
         state {dict}: state file details
+    Returns:
+        api_client_obj {ApiClient}: API client
+    """
+    key = (config.state_file_path, endpoint)
+    if key not in API_CLIENTS:
+        API_CLIENTS[key] = api_client.ApiClient(endpoint, options, config, state)
+    return API_CLIENTS[key]
+
+def write_page(endpoint, checkpoint, lines, page):
+    """ Emit the events of a page not written yet, then checkpoint it
+    Arguments:
+        endpoint {str}: endpoint name
+        checkpoint {Checkpoint}: resume point of the tenant
+        lines {list}: formatted events, as fetch_pages() made them for the sink
+        page {list}: events the lines were formatted from
+    """
+    lines, page = checkpoint.filter(endpoint, lines, page)
+    if not page:
+        return
+    for line in lines:
+        OUTPUT_SINK.write(line)
+    flush_output()
+    checkpoint.advance(endpoint, page)
+
+def get_endpoints(config_data):
+    """ Endpoints to fetch for the configured endpoint name
+    Arguments:
+        config_data {dict}: config file details
+    Returns:
+        tuple -- endpoint names
     """
     endpoint_map = api_client.ENDPOINT_MAP
     if config_data.endpoint in endpoint_map:
-        tuple_endpoint = endpoint_map[config_data.endpoint]
-    else:
-        tuple_endpoint = endpoint_map[DEFAULT_ENDPOINT]
+        return endpoint_map[config_data.endpoint]
+    return endpoint_map[DEFAULT_ENDPOINT]
 
-    for endpoint in tuple_endpoint:
-        get_alerts_or_events(
-            endpoint, options, config_data, state
-        )
+def run_concurrent(options, streams):
+    """ Fetch several endpoint/tenant streams at once through a single writer
+    Every stream is fetched on its own thread, pages are handed to the calling
+    thread which writes them in the order each stream produced them.
+    Arguments:
+        options {dict}: options
+        streams {list}: (endpoint, config, state, checkpoint, rate_limiter) per stream
+    Returns:
+        tuple -- (events fetched per stream, errors raised by the streams)
+    """
+    pages = queue.Queue(maxsize=max(options.pages_in_flight, 1))
+    counts = [0] * len(streams)
+    # Set when the writer fails, so fetch threads stop instead of filling the queue
+    cancel = threading.Event()
+
+    def fetch(index, endpoint, config_data, state_data, checkpoint, rate_limiter):
+        try:
+            for lines, page in fetch_pages(endpoint, options, config_data, state_data, rate_limiter):
+                if cancel.is_set():
+                    break
+                pages.put((index, endpoint, checkpoint, lines, page))
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(STREAM_DONE)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        for index, stream in enumerate(streams):
+            executor.submit(fetch, index, *stream)
+
+        remaining = len(streams)
+        try:
+            while remaining:
+                item = pages.get()
+                if item is STREAM_DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    log("Fetching failed: %s" % item)
+                    errors.append(item)
+                else:
+                    index, endpoint, checkpoint, lines, page = item
+                    counts[index] += len(page)
+                    write_page(endpoint, checkpoint, lines, page)
+        except BaseException:
+            # Unblock fetch threads waiting on the full queue so the executor can exit
+            cancel.set()
+            while remaining:
+                if pages.get() is STREAM_DONE:
+                    remaining -= 1
+            raise
+
+    return counts, errors
+
+def build_streams(options, tenants):
+    """ Endpoint streams of every tenant, sharing a rate limiter per tenant
+    Arguments:
+        options {dict}: options
+        tenants {list}: (config file details, state file details, checkpoint) per tenant
+    Returns:
+        streams {list}: (endpoint, config, state, checkpoint, rate_limiter) per stream
+    """
+    rate_limit = getattr(options, "rate_limit", 0)
+    streams = []
+    for config_data, state_data, checkpoint in tenants:
+        rate_limiter = RateLimiter(rate_limit)
+        if getattr(options, "concurrency", 1) > 1:
+            state_data = LockedState(state_data)
+        for endpoint in get_endpoints(config_data):
+            streams.append((endpoint, config_data, state_data, checkpoint, rate_limiter))
+    return streams
+
+def run(options, tenants):
+    """ Call the fetch alerts/events method
+    Arguments:
+        options {dict}: options
+        tenants {list}: (config file details, state file details, checkpoint) per tenant
+    """
+    streams = build_streams(options, tenants)
+    if getattr(options, "concurrency", 1) <= 1:
+        for endpoint, config_data, state_data, checkpoint, rate_limiter in streams:
+            get_alerts_or_events(
+                endpoint, options, config_data, state_data, checkpoint, rate_limiter
+            )
+        return
+
+    _, errors = run_concurrent(options, streams)
+    if errors:
+        raise errors[0]
+
+
+class PollSchedule:
+    """ Adaptive polling interval of one endpoint stream.
+    A poll that returned at least a full page means the stream is behind, it
+    is polled again after the minimum interval. A poll with fewer events
+    halves the interval, an empty poll doubles it up to the maximum.
+    """
+
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min_interval
+        self.due = 0.0
+
+    def update(self, count):
+        """ Schedule the next poll
+        Arguments:
+            count {int}: events fetched by the last poll
+        """
+        if count >= PAGE_SIZE:
+            self.interval = self.min_interval
+        elif count:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * 2)
+        self.due = time.monotonic() + self.interval
+
+
+def poll_streams(options, streams):
+    """ Fetch every stream once, a failing stream counts as an empty poll
+    Arguments:
+        options {dict}: options
+        streams {list}: (endpoint, config, state, checkpoint, rate_limiter) per stream
+    Returns:
+        counts {list}: events fetched per stream
+    """
+    if getattr(options, "concurrency", 1) > 1:
+        counts, _ = run_concurrent(options, streams)
+        return counts
+
+    counts = []
+    for endpoint, config_data, state_data, checkpoint, rate_limiter in streams:
+        try:
+            counts.append(get_alerts_or_events(
+                endpoint, options, config_data, state_data, checkpoint, rate_limiter
+            ))
+        except Exception as e:
+            log("Fetching failed: %s" % e)
+            counts.append(0)
+    return counts
+
+
+def run_daemon(options, tenants):
+    """ Poll every endpoint of every tenant until SIGTERM or SIGINT
+    Arguments:
+        options {dict}: options
+        tenants {list}: (config file details, state file details, checkpoint) per tenant
+    """
+    streams = build_streams(options, tenants)
+    schedules = [PollSchedule(options.poll_min, options.poll_max) for _ in streams]
+    while not STOP.is_set():
+        now = time.monotonic()
+        due = [index for index, schedule in enumerate(schedules) if schedule.due <= now]
+        if due:
+            counts = poll_streams(options, [streams[index] for index in due])
+            for index, count in zip(due, counts):
+                schedules[index].update(count)
+            for _, _, checkpoint in tenants:
+                checkpoint.flush()
+        STOP.wait(max(0.0, min(schedule.due for schedule in schedules) - time.monotonic()))
+
+
+def request_stop(signum, frame):
+    """ Signal handler stopping --daemon mode after the current page """
+    log("Received signal %d, stopping" % signum)
+    STOP.set()
 
 
 def main():
+    global OUTPUT_SINK
     options = parse_args_options()
     config_data = load_config(options.config)
-    state_data = state.State(options, config_data.state_file_path)
-    run(options, config_data, state_data)
+    tenants = [
+        (
+            tenant_config,
+            state.State(options, tenant_config.state_file_path),
+            # An explicit --since asks for the events again
+            Checkpoint(
+                tenant_config.state_file_path + CHECKPOINT_SUFFIX,
+                options.checkpoint_interval,
+                resume=not options.since,
+            ),
+        )
+        for tenant_config in split_tenants(config_data)
+    ]
+    OUTPUT_SINK = sinks.open_sink(
+        options.sink, SIEM_LOGGER, options.flush_size, options.flush_interval
+    )
+    try:
+        if options.daemon:
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+            run_daemon(options, tenants)
+        else:
+            run(options, tenants)
+    finally:
+        OUTPUT_SINK.close()
+        for _, _, checkpoint in tenants:
+            checkpoint.close()
+    if options.debug:
+        cache = normalize_dhost.cache_info()
+        log("dhost cache: %d hits, %d misses, %d/%d entries"
+            % (cache.hits, cache.misses, cache.currsize, cache.maxsize))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
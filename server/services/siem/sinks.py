@@ -0,0 +1,235 @@
+import errno
+import logging
+import logging.handlers
+import os
+import socket
+import sys
+import time
+
+DEFAULT_FLUSH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+# Events kept for a retry while the output keeps failing, the oldest are dropped beyond it
+DEFAULT_MAX_BUFFERED = 100000
+# user.info, the priority SysLogHandler gives INFO records by default
+SYSLOG_PRIORITY = (logging.handlers.SysLogHandler.LOG_USER << 3) | logging.handlers.SysLogHandler.LOG_INFO
+
+
+def log(s):
+    sys.stderr.write("%s\n" % s)
+
+
+class Sink:
+    """ Buffered output for formatted events.
+    Events are lines without a trailing newline, UTF-8 encoded unless the
+    sink sets encoded to False and takes them as str. They are written
+    flush_size at a time, or once flush_interval seconds have passed since
+    the last flush, whichever comes first. Events a failed flush did not
+    deliver are kept for the next one, at most max_buffered of them.
+    """
+
+    # Whether write() takes bytes rather than str
+    encoded = True
+
+    def __init__(self, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_buffered=DEFAULT_MAX_BUFFERED):
+        self.flush_size = max(flush_size, 1)
+        self.flush_interval = flush_interval
+        self.max_buffered = max(max_buffered, self.flush_size)
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def write(self, line):
+        """ Queue one event
+        Arguments:
+            line {bytes}: encoded event, str when encoded is False
+        """
+        self.buffer.append(line)
+        if (
+            len(self.buffer) >= self.flush_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """ Write out every queued event """
+        if self.buffer:
+            lines, self.buffer = self.buffer, []
+            try:
+                self.write_batch(lines)
+            except Exception:
+                # Keep the undelivered events so a later flush sends them, ahead of newer ones
+                self.buffer[:0] = lines
+                dropped = len(self.buffer) - self.max_buffered
+                if dropped > 0:
+                    del self.buffer[:dropped]
+                    log("Output failing, dropped the %d oldest buffered events" % dropped)
+                raise
+        self.last_flush = time.monotonic()
+
+    def write_batch(self, lines):
+        """ Write a batch of events, on failure the lines already delivered
+        are removed from the list before raising
+        Arguments:
+            lines {list}: encoded events
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ Flush and release the output """
+        self.flush()
+
+
+class LoggingSink(Sink):
+    """ Hand every event to a logger, the historical output path. """
+
+    encoded = False
+
+    def __init__(self, logger):
+        super().__init__(flush_size=1)
+        self.logger = logger
+
+    def write(self, line):
+        self.logger.info(line)
+
+    def flush(self):
+        for handler in self.logger.handlers:
+            handler.flush()
+
+
+class StreamSink(Sink):
+    """ Write events to a binary stream, one per line. """
+
+    def __init__(self, stream, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = stream
+
+    def write_batch(self, lines):
+        self.stream.write(b"\n".join(lines) + b"\n")
+        self.stream.flush()
+
+
+class FileSink(StreamSink):
+    """ Append events to a file, one per line. """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(open(path, "ab"), **kwargs)
+        self.path = path
+
+    def close(self):
+        super().close()
+        self.stream.close()
+
+
+class RotatingFileSink(FileSink):
+    """ Append events to a file, rotating it like RotatingFileHandler once it reaches max_bytes. """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT, **kwargs):
+        super().__init__(path, **kwargs)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def write_batch(self, lines):
+        size = sum(len(line) + 1 for line in lines)
+        if self.max_bytes and self.stream.tell() and self.stream.tell() + size > self.max_bytes:
+            self.rotate()
+        super().write_batch(lines)
+
+    def rotate(self):
+        self.stream.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = "%s.%d" % (self.path, index)
+            if os.path.exists(source):
+                os.replace(source, "%s.%d" % (self.path, index + 1))
+        if self.backup_count:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self.stream = open(self.path, "ab")
+
+
+class SyslogSink(Sink):
+    """ Send events to a syslog server.
+    Over UDP every event is its own datagram, over TCP a batch is sent with
+    a single call, one newline terminated event per line.
+    """
+
+    def __init__(self, host, port, protocol="udp", priority=SYSLOG_PRIORITY, **kwargs):
+        super().__init__(**kwargs)
+        self.address = (host, port)
+        self.protocol = protocol
+        self.prefix = b"<%d>" % priority
+        self.socket = None
+
+    def connect(self):
+        if self.protocol == "tcp":
+            self.socket = socket.create_connection(self.address)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def write_batch(self, lines):
+        try:
+            if self.socket is None:
+                self.connect()
+            if self.protocol == "tcp":
+                self.socket.sendall(b"".join(self.prefix + line + b"\n" for line in lines))
+            else:
+                self.send_datagrams(lines)
+        except OSError:
+            # Reconnect on the next batch, e.g. once a restarted server listens again
+            self.close_socket()
+            raise
+
+    def send_datagrams(self, lines):
+        sent = 0
+        try:
+            for line in lines:
+                try:
+                    self.socket.sendto(self.prefix + line, self.address)
+                except OSError as e:
+                    if e.errno != errno.EMSGSIZE:
+                        raise
+                    # Retrying can never succeed, skip the event
+                    log("Dropped a %d byte event larger than a syslog datagram" % len(line))
+                sent += 1
+        finally:
+            del lines[:sent]
+
+    def close_socket(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.close_socket()
+
+
+def open_sink(spec, logger, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+    """ Create the sink described by spec
+    Arguments:
+        spec {str}: logging, stdout, file:PATH, rotating:PATH, udp://HOST:PORT or tcp://HOST:PORT
+        logger {Logger}: logger used by the logging sink
+        flush_size {int}: events per batch
+        flush_interval {float}: seconds between flushes
+    Returns:
+        sink {Sink}: the output sink
+    """
+    options = {"flush_size": flush_size, "flush_interval": flush_interval}
+    if not spec or spec == "logging":
+        return LoggingSink(logger)
+    if spec == "stdout":
+        return StreamSink(sys.stdout.buffer, **options)
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):], **options)
+    if spec.startswith("rotating:"):
+        return RotatingFileSink(spec[len("rotating:"):], **options)
+    for protocol in ("udp", "tcp"):
+        if spec.startswith(protocol + "://"):
+            host, _, port = spec[len(protocol) + 3:].rpartition(":")
+            return SyslogSink(host, int(port), protocol, **options)
+    raise Exception("Invalid sink %s, sink can be logging, stdout, file:PATH, rotating:PATH, "
+                    "udp://HOST:PORT or tcp://HOST:PORT" % spec)